@@ -0,0 +1,132 @@
+# artifact.py
+# Prebuilt, read-only index for serverless deploys, where DB_PATH sits on an
+# ephemeral filesystem and every cold instance would otherwise start empty.
+#
+#   python artifact.py build [--out index/agri_docs.db] [--no-crawl]
+#
+# crawls into the shards as usual, then writes a compacted copy of each shard
+# (documents + FTS5 index, single file, no WAL) stamped with FORMAT_VERSION in
+# PRAGMA user_version, and copies the semantic index next to --out. main.py opens
+# the artifact with immutable=1 and a memory-mapped read path, so a cold
+# instance serves its first query without crawling or copying anything.
+#
+# vercel.json runs it as the deploy's buildCommand, so every deployment ships
+# the index/ it just crawled (see README).
+import argparse
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = str(Path(__file__).with_name("index") / "agri_docs.db")
+
+
+def semantic_path(path: str) -> str:
+    return path + ".semantic.npz"
+
+
+def uri(path: str) -> str:
+    # immutable: no locking and no change detection, the file never changes
+    return Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+
+
+def export(db_path: str, out: str) -> dict:
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    tmp = out + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    src = sqlite3.connect(db_path)
+    try:
+        src.execute("VACUUM INTO ?", (tmp,))
+    finally:
+        src.close()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        has_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='documents_fts'"
+        ).fetchone() is not None
+        if has_fts:
+            # merge the FTS b-trees built up by incremental writes into one
+            conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('optimize')")
+        meta = {"version": FORMAT_VERSION, "built_at": int(time.time()),
+                "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+                "fts": int(has_fts)}
+        conn.execute("CREATE TABLE artifact_meta (key TEXT PRIMARY KEY, value)")
+        conn.executemany("INSERT INTO artifact_meta VALUES (?,?)", meta.items())
+        conn.execute(f"PRAGMA user_version={FORMAT_VERSION}")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, out)
+    return meta
+
+
+def export_semantic(semantic_index_path: str, out: str):
+    if os.path.exists(semantic_index_path):
+        shutil.copyfile(semantic_index_path, semantic_path(out) + ".tmp")
+        os.replace(semantic_path(out) + ".tmp", semantic_path(out))
+
+
+def check(path: str) -> dict | None:
+    # metadata of a usable artifact, None when missing or built by another version
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(uri(path), uri=True)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != FORMAT_VERSION:
+                print(f"Ignoring index artifact {path}: version {version}, expected {FORMAT_VERSION}")
+                return None
+            return dict(conn.execute("SELECT key, value FROM artifact_meta").fetchall())
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        print(f"Ignoring index artifact {path}:", e)
+        return None
+
+
+def build(out: str, crawl: bool = True) -> dict:
+    # one artifact per committee shard, named like the shards (see main.shard_file);
+    # the semantic index spans all shards and goes next to `out`
+    import asyncio
+
+    import main
+
+    async def run():
+        main.ensure_db()
+        if crawl:
+            await main.crawl_and_index()
+        # a crawl that changed nothing leaves the semantic index as it was
+        if not crawl or not os.path.exists(main.SEMANTIC_INDEX_PATH):
+            await main.refresh_semantic_index(await main.refresh_snapshot())
+
+    asyncio.run(run())
+    main.close_writer()
+    metas = {}
+    for committee in main.COMMITTEES:
+        with sqlite3.connect(main.shard_path(committee)) as conn:
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        if not documents:
+            # a failed build-time crawl must not ship an empty index; an
+            # instance without one crawls at startup (main.startup)
+            print(f"Skipping {committee} shard: no documents")
+            continue
+        metas[committee] = export(main.shard_path(committee), main.shard_file(out, committee))
+    if metas:
+        export_semantic(main.SEMANTIC_INDEX_PATH, out)
+    return metas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the read-only index artifact")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default=os.getenv("INDEX_ARTIFACT", DEFAULT_PATH))
+    parser.add_argument("--no-crawl", action="store_true", help="export the shards as they are")
+    args = parser.parse_args()
+    for committee, meta in build(args.out, crawl=not args.no_crawl).items():
+        print(f"Wrote {committee} shard: {meta['documents']} documents")
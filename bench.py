@@ -0,0 +1,422 @@
+# bench.py
+# Reproducible benchmarks for the indexing, search and chat paths.
+#
+# Every corpus size runs in its own subprocess with a fresh SQLite file, so
+# peak memory is per size and no state leaks between runs; the crawl gets a
+# second subprocess and file, seeded with the same corpus, so the corpus the
+# other components see holds exactly N rows. Each component runs under
+# tracemalloc and reports its Python-heap peak (--no-trace-memory turns this
+# off: tracing slows allocation-heavy paths). A stand-in listing/detail server
+# and a stub worker run on local ports; nothing leaves the machine. Results are
+# written as JSON for comparison across runs.
+#
+#   python bench.py --sizes 1000 10000 100000 --out bench_results/run.json
+#   python bench.py --sizes 1000000 --components upsert load rank search
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+COMPONENTS = ("crawl", "upsert", "load", "rank", "search", "chat")
+
+TOPICS = (
+    "common agricultural policy", "CAP direct payments", "farm subsidies", "rural development",
+    "fisheries quotas", "animal welfare during transport", "plant protection products",
+    "organic production and labelling", "milk and dairy markets", "sugar sector",
+    "agricultural trade with Mercosur", "water resilience and drought", "soil monitoring",
+    "new genomic techniques", "forest strategy", "young farmers", "food security",
+    "pesticide reduction", "wine sector", "livestock emissions",
+)
+DOC_TYPES = ("Opinion", "Draft report", "Amendments", "Report", "Working document", "Briefing")
+FILLER = ("committee", "member", "states", "commission", "proposal", "regulation", "amendment",
+          "farmers", "market", "support", "measures", "european", "parliament", "council",
+          "sustainability", "income", "production", "sector", "climate", "budget")
+
+
+# --- synthetic corpus
+def synthetic_rows(n: int, seed: int = 0, offset: int = 0, base_url: str = "https://example.test"):
+    rnd = random.Random(seed)
+    for i in range(offset, offset + n):
+        topic = rnd.choice(TOPICS)
+        dtype = rnd.choice(DOC_TYPES)
+        other = rnd.choice(TOPICS)
+        excerpt = " ".join(
+            [f"The Committee on Agriculture and Rural Development considers {topic}."]
+            + rnd.choices(FILLER, k=rnd.randint(20, 60))
+            + [f"See also {other}."]
+        )
+        yield {"title": f"{dtype} on {topic} ({i})", "url": f"{base_url}/documents/{i}",
+               "doc_type": dtype, "date": f"20{rnd.randint(15, 25)}-{rnd.randint(1, 12):02d}-01",
+               "excerpt": excerpt}
+
+
+def detail_html(row: dict) -> str:
+    return (f"<html><head><title>{row['title']}</title></head><body>"
+            f"<h1 class=\"ep_title\">{row['title']}</h1><span class=\"ep_date\">{row['date']}</span>"
+            f"<p>{row['excerpt']}</p><div>{row['doc_type']}</div>"
+            + "<div class=\"nav\">" + "<a href=\"#\">link</a>" * 200 + "</div></body></html>")
+
+
+def queries(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    words = [w for t in TOPICS for w in t.split() if len(w) > 3]
+    out = []
+    for _ in range(n):
+        kind = rnd.random()
+        if kind < 0.4:
+            out.append(rnd.choice(TOPICS))
+        elif kind < 0.8:
+            out.append(" ".join(rnd.sample(words, 2)))
+        else:
+            out.append(rnd.choice(words))
+    return out
+
+
+# --- local servers
+def free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def stub_worker_app(latency: float, streaming: bool = True):
+    # answers any POST with a fixed completion; "stream": true gets chunked SSE
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            msg = await receive()
+            body += msg.get("body", b"")
+            if not msg.get("more_body"):
+                break
+        await asyncio.sleep(latency)
+        stream = streaming and b'"stream":true' in body
+        ctype = b"text/event-stream" if stream else b"application/json"
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", ctype)]})
+        if not stream:
+            await send({"type": "http.response.body", "body": b'{"reply":"[]"}'})
+            return
+        for token in (b"[", b"]"):
+            chunk = b'data: {"choices":[{"delta":{"content":"' + token + b'"}}]}\n\n'
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+    return app
+
+
+def site_app(rows: list, latency: float):
+    # listing page with absolute links plus one detail page per row
+    base = rows[0]["url"].rsplit("/documents/", 1)[0] if rows else ""
+    listing = "".join(f'<a href="{r["url"]}">{r["title"]}</a>' for r in rows).encode()
+    pages = {r["url"][len(base):]: detail_html(r).encode() for r in rows}
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await asyncio.sleep(latency)
+        path = scope["path"]
+        body = listing if path == "/listing" else pages.get(path)
+        status = 200 if body is not None else 404
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/html; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": body or b""})
+    return app
+
+
+# --- measurement
+def summarize(latencies: list, elapsed: float, items: int | None = None) -> dict:
+    lat = sorted(latencies)
+
+    def pct(p):
+        return lat[min(len(lat) - 1, int(p / 100 * len(lat)))] * 1000 if lat else 0.0
+
+    count = items if items is not None else len(lat)
+    return {"n": len(lat), "p50_ms": round(pct(50), 3), "p95_ms": round(pct(95), 3),
+            "p99_ms": round(pct(99), 3), "mean_ms": round(sum(lat) / len(lat) * 1000, 3) if lat else 0.0,
+            "throughput_per_s": round(count / elapsed, 2) if elapsed else 0.0, "elapsed_s": round(elapsed, 3)}
+
+
+def timed(fn, repeat: int):
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        s = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - s)
+    return lat, time.perf_counter() - t0
+
+
+def peak_memory(fn, enabled: bool = True) -> tuple:
+    # fn() and the Python-heap peak it reached under tracemalloc (None if disabled)
+    if not enabled:
+        return fn(), None
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def timed_transport(latencies: list, **kwargs):
+    # an HTTP transport recording (path, seconds) per request, measured up to
+    # the end of its body or the early close of a truncated read
+    import httpx
+
+    class TimedTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            start = time.perf_counter()
+            resp = await super().handle_async_request(request)
+            body = resp.stream
+
+            class Stream(httpx.AsyncByteStream):
+                async def __aiter__(self):
+                    async for chunk in body:
+                        yield chunk
+
+                async def aclose(self):
+                    latencies.append((request.url.path, time.perf_counter() - start))
+                    await body.aclose()
+
+            return httpx.Response(resp.status_code, headers=resp.headers, stream=Stream(),
+                                  extensions=resp.extensions)
+
+    return TimedTransport(**kwargs)
+
+
+# --- components (run inside the per-size subprocess)
+def bench_crawl(main, args) -> dict:
+    # the crawl's own subprocess, into a copy of the size-N corpus; the peak
+    # includes the stand-in site, which serves from this process too
+    import httpx
+
+    import crawler
+    import jobs
+
+    port = free_port()
+    rows = list(synthetic_rows(args.crawl_pages, seed=7, base_url=f"http://127.0.0.1:{port}"))
+    serve(site_app(rows, args.site_latency), port)
+    main.SCRAPER_BASE_URL = f"http://127.0.0.1:{port}/listing"
+    main.CRAWL_LIMIT = len(rows)
+    main.CRAWL_RATE_PER_HOST = 0
+    fetches = []
+    limits = httpx.Limits(max_connections=main.CRAWL_WORKERS, max_keepalive_connections=main.CRAWL_WORKERS)
+    transport = timed_transport(fetches, limits=limits)
+    progress = jobs.CrawlProgress()
+    t0 = time.perf_counter()
+    asyncio.run(main.crawl_and_index(transport=transport, progress=progress))
+    elapsed = time.perf_counter() - t0
+    result = summarize([lat for path, lat in fetches if path != "/listing"], elapsed, items=len(rows))
+    result.update({"pages": len(rows), "upserted": progress.upserted, "failed": progress.failed,
+                   "listing_ms": [round(lat * 1000, 3) for path, lat in fetches if path == "/listing"],
+                   "workers": main.CRAWL_WORKERS, "chunk_size": crawler.CHUNK_SIZE})
+    return result
+
+
+def seed_corpus(main, n: int) -> list:
+    # the size-N corpus in UPSERT_BATCH_SIZE batches; latency of each batch
+    batch_lat = []
+    batch = []
+    for row in synthetic_rows(n):
+        batch.append(row)
+        if len(batch) >= main.UPSERT_BATCH_SIZE:
+            s = time.perf_counter()
+            main.upsert_documents(batch)
+            batch_lat.append(time.perf_counter() - s)
+            batch = []
+    main.upsert_documents(batch)
+    return batch_lat
+
+
+def bench_upsert(main, args) -> dict:
+    t0 = time.perf_counter()
+    batch_lat = seed_corpus(main, args.size)
+    bulk = summarize(batch_lat, time.perf_counter() - t0, items=args.size)
+    single_rows = list(synthetic_rows(min(args.size, 500), seed=3, offset=10 ** 9))
+    it = iter(single_rows)
+    lat, elapsed = timed(lambda: main.upsert_document(**next(it)), len(single_rows))
+    # the single-row inserts are removed again so later components see N rows
+    conn = main.get_writer()
+    with conn:
+        conn.executemany("DELETE FROM documents WHERE url = ?", [(r["url"],) for r in single_rows])
+    return {"bulk": bulk, "single": summarize(lat, elapsed)}
+
+
+def bench_load(main, args) -> dict:
+    repeat = max(3, min(50, 200000 // max(args.size, 1)))
+    lat, elapsed = timed(main.load_all_documents, repeat)
+    return summarize(lat, elapsed)
+
+
+def bench_rank(main, args) -> dict:
+    rows = main.load_all_documents()
+    qs = queries(args.queries)
+    n = max(5, min(len(qs), 2000000 // max(args.size, 1)))
+    it = iter(qs * 2)
+    lat, elapsed = timed(lambda: main.rank_results(rows, next(it))[:main.TOP_K_DEFAULT], n)
+    result = {"rank_results": summarize(lat, elapsed)}
+
+    snapshot = asyncio.run(main.refresh_snapshot())
+    t0 = time.perf_counter()
+    engine = main.ranking.RankingEngine(snapshot)
+    build = time.perf_counter() - t0
+    it = iter(qs)
+    lat, elapsed = timed(lambda: engine.search(next(it), main.TOP_K_DEFAULT), len(qs))
+    result["engine"] = summarize(lat, elapsed)
+    result["engine"]["build_s"] = round(build, 3)
+    result["snapshot"] = snapshot.stats()
+    return result
+
+
+def bench_search(main, args) -> dict:
+    qs = queries(args.queries)
+    it = iter(qs)
+    lat, elapsed = timed(lambda: main.search_documents(next(it), main.TOP_K_DEFAULT), len(qs))
+    result = summarize(lat, elapsed)
+    result["backend"] = "memory" if main.memory_search_enabled() else "fts"
+    return result
+
+
+def bench_chat(main, args) -> dict:
+    import httpx
+
+    import handler
+
+    port = free_port()
+    serve(stub_worker_app(args.worker_latency), port)
+    main.WORKER_URL = f"http://127.0.0.1:{port}"
+    main.WORKER_SHARED_SECRET = main.WORKER_SHARED_SECRET or "bench"
+    main.answer_cache.max_entries = 0  # measure the full path, not cache hits
+    qs = queries(args.chat_requests, seed=5)
+
+    async def run():
+        await main.refresh_snapshot()
+        lat = []
+        errors = 0
+        it = iter(qs)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app",
+                                     timeout=60) as client:
+            async def user():
+                nonlocal errors
+                for q in it:
+                    s = time.perf_counter()
+                    r = await client.post("/api/chat", json={"q": q})
+                    lat.append(time.perf_counter() - s)
+                    errors += r.status_code != 200
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - t0
+        await handler.close_client()
+        return lat, elapsed, errors
+
+    lat, elapsed, errors = asyncio.run(run())
+    result = summarize(lat, elapsed)
+    result.update({"errors": errors, "concurrency": args.concurrency, "worker_latency_s": args.worker_latency})
+    return result
+
+
+def run_size(args) -> dict:
+    import resource
+
+    import main
+
+    def measured(name: str) -> dict:
+        result, peak = peak_memory(lambda: globals()[f"bench_{name}"](main, args), args.trace_memory)
+        if peak is not None:
+            result["peak_bytes"] = peak
+        return result
+
+    main.ensure_db()
+    results = {}
+    if args.phase == "crawl":
+        seed_corpus(main, args.size)
+        results["crawl"] = measured("crawl")
+    else:
+        # the seeding upsert always runs: every other component needs the corpus
+        results["upsert"] = measured("upsert")
+        for name in COMPONENTS:
+            if name in args.components and name not in results and name != "crawl":
+                results[name] = measured(name)
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return results
+
+
+def run_subprocess(size: int, phase: str) -> dict:
+    # one size (and phase) in a fresh interpreter against a fresh SQLite file
+    tmp = tempfile.mkdtemp()
+    env = {**os.environ, "DB_PATH": os.path.join(tmp, "bench.db"), "INDEX_ARTIFACT": ""}
+    cmd = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--phase", phase, *sys.argv[1:]]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        return {"error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="AGRI search/index/chat benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--components", nargs="+", default=list(COMPONENTS), choices=COMPONENTS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--crawl-pages", type=int, default=500)
+    parser.add_argument("--site-latency", type=float, default=0.01)
+    parser.add_argument("--chat-requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--worker-latency", type=float, default=0.05)
+    parser.add_argument("--trace-memory", action=argparse.BooleanOptionalAction, default=True,
+                        help="report each component's tracemalloc peak")
+    parser.add_argument("--out", default=None, help="JSON output path (default bench_results/<timestamp>.json)")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)  # internal: run one size in-process
+    parser.add_argument("--phase", default="corpus", choices=("corpus", "crawl"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size is not None:
+        # app logging goes to stderr; stdout carries only the JSON result
+        out, sys.stdout = sys.stdout, sys.stderr
+        result = run_size(args)
+        out.write(json.dumps(result) + "\n")
+        return
+
+    report = {"meta": {"timestamp": int(time.time()), "python": platform.python_version(),
+                       "platform": platform.platform(), "cpus": os.cpu_count(), "args": vars(args)},
+              "results": {}}
+    for size in args.sizes:
+        print(f"size {size}...", file=sys.stderr)
+        result = run_subprocess(size, "corpus")
+        if "crawl" in args.components and "error" not in result:
+            crawl = run_subprocess(size, "crawl")
+            result["crawl"] = crawl.get("crawl", crawl)
+        report["results"][str(size)] = result
+
+    out = args.out or os.path.join("bench_results", f"{report['meta']['timestamp']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"written to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,64 @@
+# corpus.py
+# Immutable in-memory view of the documents table. A Snapshot is built once
+# per reindex and swapped in as a whole; its generation number lets caches
+# and derived indexes key on the corpus version they were computed from.
+import sys
+import time
+from typing import Iterable, List
+
+
+class Doc:
+    __slots__ = ("title", "url", "doc_type", "date", "excerpt", "committee", "title_l", "excerpt_l")
+
+    def __init__(self, title: str, url: str, doc_type: str | None, date: str | None, excerpt: str | None,
+                 committee: str | None = None):
+        self.title = title or ""
+        self.url = url
+        self.doc_type = doc_type
+        self.date = date
+        self.excerpt = excerpt
+        self.committee = committee
+        # pre-lowercased once here instead of per query
+        self.title_l = self.title.lower()
+        self.excerpt_l = (excerpt or "").lower()
+
+    def to_dict(self) -> dict:
+        return {"title": self.title, "url": self.url, "doc_type": self.doc_type,
+                "date": self.date, "excerpt": self.excerpt, "committee": self.committee}
+
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+
+class Snapshot:
+    __slots__ = ("docs", "generation", "built_at", "nbytes", "_by_url")
+
+    def __init__(self, docs: Iterable[Doc], generation: int):
+        self.docs = tuple(docs)
+        self.generation = generation
+        self.built_at = int(time.time())
+        self.nbytes = sys.getsizeof(self.docs) + sum(d.nbytes() for d in self.docs)
+        self._by_url = None
+
+    def by_url(self) -> dict:
+        # built on first use; only URL-keyed consumers (semantic hits) need it
+        if self._by_url is None:
+            self._by_url = {d.url: d for d in self.docs}
+        return self._by_url
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def stats(self) -> dict:
+        return {"generation": self.generation, "documents": len(self.docs), "built_at": self.built_at,
+                "bytes": self.nbytes, "bytes_per_doc": round(self.nbytes / len(self.docs)) if self.docs else 0}
+
+
+def build_snapshot(rows: List[dict], generation: int) -> Snapshot:
+    return Snapshot((Doc(r["title"], r["url"], r.get("doc_type"), r.get("date"), r.get("excerpt"), r.get("committee"))
+                     for r in rows), generation)
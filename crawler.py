@@ -0,0 +1,139 @@
+# crawler.py
+# Bounded-concurrency fetch engine used by crawl_and_index: a fixed pool of
+# workers shares one keep-alive client, requests to the same host are spaced
+# out, and transient failures (timeouts, 5xx, 429) are retried with backoff.
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Iterable
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BINARY_EXTENSIONS = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".zip")
+TEXT_TYPES = ("text/", "application/xhtml", "application/xml")
+CHUNK_SIZE = 16384
+
+
+def is_binary_url(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith(BINARY_EXTENSIONS)
+
+
+def is_text_response(resp: httpx.Response) -> bool:
+    ctype = resp.headers.get("content-type", "text/html").lower()
+    return ctype.startswith(TEXT_TYPES)
+
+
+class HostRateLimiter:
+    # min_interval between request starts per host, covering both the
+    # requests-per-second cap and the politeness delay
+    def __init__(self, rate_per_host: float = 0.0, delay: float = 0.0):
+        interval = 1.0 / rate_per_host if rate_per_host > 0 else 0.0
+        self.min_interval = max(interval, delay)
+        self._next_slot: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def wait(self, url: str):
+        if self.min_interval <= 0:
+            return
+        host = urlsplit(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = self._next_slot.get(host, now)
+            if slot > now:
+                await asyncio.sleep(slot - now)
+                now = slot
+            self._next_slot[host] = now + self.min_interval
+
+
+def make_client(workers: int, timeout: float = 30, transport: httpx.AsyncBaseTransport | None = None,
+                **kwargs) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+    return httpx.AsyncClient(timeout=timeout, limits=limits, transport=transport, **kwargs)
+
+
+async def read_truncated(resp: httpx.Response, max_bytes: int,
+                         is_complete: Callable[[bytes], bool] | None = None) -> httpx.Response:
+    # Read a streamed body until is_complete(prefix) holds or max_bytes is hit,
+    # then drop the connection. Non-text bodies are not read at all. Returns a
+    # buffered Response over the bytes actually read.
+    body = bytearray()
+    try:
+        if resp.status_code == 200 and is_text_response(resp):
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                body += chunk
+                if len(body) >= max_bytes or (is_complete is not None and is_complete(bytes(body))):
+                    break
+    finally:
+        await resp.aclose()
+    headers = [(k, v) for k, v in resp.headers.multi_items()
+               if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(resp.status_code, headers=headers, content=bytes(body[:max_bytes]),
+                          request=resp.request)
+
+
+async def fetch_with_retry(client: httpx.AsyncClient, url: str, limiter: HostRateLimiter | None = None,
+                           retries: int = 3, backoff: float = 0.5, timeout: float = 20,
+                           method: str = "GET", max_bytes: int = 0,
+                           is_complete: Callable[[bytes], bool] | None = None,
+                           **kwargs) -> httpx.Response:
+    # max_bytes > 0 streams the body and truncates it, see read_truncated
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.wait(url)
+        try:
+            if max_bytes > 0 and method == "GET":
+                req = client.build_request(method, url, timeout=timeout, **kwargs)
+                resp = await client.send(req, stream=True)
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return await read_truncated(resp, max_bytes, is_complete)
+            else:
+                resp = await client.request(method, url, timeout=timeout, **kwargs)
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp
+            await resp.aclose()
+        except (httpx.TimeoutException, httpx.TransportError):
+            if attempt >= retries:
+                raise
+        await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+        attempt += 1
+
+
+async def crawl(client: httpx.AsyncClient, items: Iterable[dict],
+                handle: Callable[[dict, httpx.Response | None, Exception | None], Awaitable[None]],
+                workers: int = 8, limiter: HostRateLimiter | None = None,
+                retries: int = 3, backoff: float = 0.5, timeout: float = 20,
+                headers_for: Callable[[dict], dict | None] | None = None,
+                max_bytes: int = 0, is_complete: Callable[[bytes], bool] | None = None):
+    # handle(item, response, error) is awaited for every item as soon as its
+    # fetch settles, so callers can stream results into batched writes;
+    # headers_for(item) supplies per-request headers (e.g. conditional GETs).
+    # Binary documents (PDFs etc.) only get a HEAD request.
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                headers = headers_for(item) if headers_for is not None else None
+                method = "HEAD" if is_binary_url(item["url"]) else "GET"
+                with metrics.stage("crawl_fetch"):
+                    resp = await fetch_with_retry(client, item["url"], limiter, retries, backoff, timeout,
+                                                  method=method, max_bytes=max_bytes, is_complete=is_complete,
+                                                  headers=headers)
+            except Exception as e:
+                await handle(item, None, e)
+            else:
+                await handle(item, resp, None)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
@@ -3,9 +3,41 @@ import os
 import json
 import httpx
 
+# One pooled client for the app lifetime: chat forwarding reuses keep-alive
+# connections to WORKER_URL instead of paying TCP+TLS setup per request
+WORKER_TIMEOUT = float(os.getenv("WORKER_TIMEOUT", "30"))
+WORKER_MAX_CONNECTIONS = int(os.getenv("WORKER_MAX_CONNECTIONS", "100"))
+WORKER_MAX_KEEPALIVE = int(os.getenv("WORKER_MAX_KEEPALIVE", "20"))
+WORKER_KEEPALIVE_EXPIRY = float(os.getenv("WORKER_KEEPALIVE_EXPIRY", "30"))
+WORKER_HTTP2 = os.getenv("WORKER_HTTP2", "0") == "1"
+
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = WORKER_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401  (httpx[http2])
+            except ImportError:
+                print("WORKER_HTTP2 set but the h2 package is missing, using HTTP/1.1")
+                http2 = False
+        limits = httpx.Limits(max_connections=WORKER_MAX_CONNECTIONS,
+                              max_keepalive_connections=WORKER_MAX_KEEPALIVE,
+                              keepalive_expiry=WORKER_KEEPALIVE_EXPIRY)
+        _client = httpx.AsyncClient(timeout=WORKER_TIMEOUT, limits=limits, http2=http2)
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 async def handle_chat(payload: dict):
     # forward envelope signing logic could live here, but keep imports local to runtime
-    res = await httpx.AsyncClient().post(
+    res = await get_client().post(
         f"{os.environ.get('WORKER_URL').rstrip('/')}/chat",
         json=payload,
         headers={"Content-Type": "application/json"}
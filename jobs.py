@@ -0,0 +1,120 @@
+# jobs.py
+# Single-slot background job runner for reindexing. At most one crawl runs at
+# a time; requests arriving while it runs are coalesced into one follow-up run
+# (a full crawl if any of them asked for one) instead of starting overlapping
+# crawls that fight over bandwidth and the SQLite write lock. The running job
+# can be cancelled, and schedule() triggers a refresh every `interval` seconds.
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+
+class CrawlProgress:
+    __slots__ = ("new_only", "listed", "fetched", "parsed", "upserted", "skipped", "failed",
+                 "started_at", "finished_at", "state", "error")
+
+    def __init__(self, new_only: bool = False):
+        self.new_only = new_only
+        self.listed = 0
+        self.fetched = 0
+        self.parsed = 0
+        self.upserted = 0
+        self.skipped = 0  # 304s and pages whose content hash did not change
+        self.failed = 0
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+        self.state = "running"  # running | done | failed | cancelled
+        self.error: str | None = None
+
+    def finish(self, state: str, error: str | None = None):
+        self.state = state
+        self.error = error or self.error
+        self.finished_at = time.time()
+
+    def stats(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {"state": self.state, "new_only": self.new_only, "listed": self.listed,
+                "fetched": self.fetched, "parsed": self.parsed, "upserted": self.upserted,
+                "skipped": self.skipped, "failed": self.failed, "error": self.error,
+                "started_at": int(self.started_at),
+                "finished_at": int(self.finished_at) if self.finished_at else None,
+                "elapsed": round(elapsed, 3),
+                "pages_per_second": round(self.fetched / elapsed, 2) if elapsed > 0 else 0.0}
+
+
+class JobRunner:
+    def __init__(self, run: Callable[..., Awaitable[None]]):
+        # run(progress=..., new_only=...) performs one crawl
+        self._run = run
+        self._task: asyncio.Task | None = None
+        self._pending: bool | None = None  # new_only of the coalesced follow-up, None = none queued
+        self._schedule: asyncio.Task | None = None
+        self.current: CrawlProgress | None = None
+        self.last: CrawlProgress | None = None
+        self.runs = 0
+        self.coalesced = 0
+
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, new_only: bool = False) -> bool:
+        # True when a crawl was started, False when coalesced into a follow-up
+        if self.running():
+            self.coalesced += 1
+            self._pending = new_only if self._pending is None else (self._pending and new_only)
+            return False
+        self.current = CrawlProgress(new_only)
+        self._task = asyncio.create_task(self._execute(self.current))
+        self.runs += 1
+        return True
+
+    async def _execute(self, progress: CrawlProgress):
+        try:
+            await self._run(progress=progress, new_only=progress.new_only)
+        except asyncio.CancelledError:
+            progress.finish("cancelled")
+            raise
+        except Exception as e:
+            print("Reindex failed", e)
+            progress.finish("failed", str(e))
+        else:
+            progress.finish("failed" if progress.error else "done")
+        finally:
+            self.last, self.current = progress, None
+            pending, self._pending = self._pending, None
+            if pending is not None and progress.state != "cancelled":
+                self.current = CrawlProgress(pending)
+                self._task = asyncio.create_task(self._execute(self.current))
+                self.runs += 1
+
+    def cancel(self) -> bool:
+        self._pending = None
+        if not self.running():
+            return False
+        self._task.cancel()
+        return True
+
+    def schedule(self, interval: float, new_only: bool = False):
+        async def loop():
+            while True:
+                await asyncio.sleep(interval)
+                self.start(new_only)
+
+        if interval > 0 and self._schedule is None:
+            self._schedule = asyncio.create_task(loop())
+
+    async def close(self):
+        for task in (self._schedule, self._task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._schedule = None
+
+    def status(self) -> dict:
+        return {"running": self.running(), "pending": self._pending is not None,
+                "runs": self.runs, "coalesced": self.coalesced,
+                "current": self.current.stats() if self.current else None,
+                "last": self.last.stats() if self.last else None}
@@ -0,0 +1,97 @@
+# loadtest.py
+# Mixed /api/search + /api/chat load against the app in-process, with a stub
+# worker on a local port standing in for the Cloudflare worker. Corpus and stub
+# come from bench.py.
+#
+#   python loadtest.py --docs 5000 --concurrency 64 --requests 2000 --chat-ratio 0.3
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import bench
+
+WORDS = ("agriculture", "CAP", "direct", "payments", "farm", "subsidies", "fisheries", "rural",
+         "development", "livestock", "organic", "pesticides", "water", "climate", "trade", "dairy")
+
+
+def seed(main, n: int):
+    batch = []
+    for row in bench.synthetic_rows(n):
+        batch.append(row)
+        if len(batch) >= 1000:
+            main.upsert_documents(batch)
+            batch = []
+    main.upsert_documents(batch)
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def run(args):
+    import httpx
+    import main
+
+    main.ensure_db()
+    seed(main, args.docs)
+    port = bench.free_port()
+    bench.serve(bench.stub_worker_app(args.worker_latency), port)
+    main.WORKER_URL = f"http://127.0.0.1:{port}"
+    main.WORKER_SHARED_SECRET = main.WORKER_SHARED_SECRET or "loadtest"
+
+    rnd = random.Random(1)
+    latencies = {"search": [], "chat": []}
+    errors = {"search": 0, "chat": 0}
+    remaining = args.requests
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app",
+                                 timeout=60) as client:
+        async def user():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                q = " ".join(rnd.sample(WORDS, 2))
+                kind = "chat" if rnd.random() < args.chat_ratio else "search"
+                t0 = time.perf_counter()
+                if kind == "chat":
+                    r = await client.post("/api/chat", json={"q": q})
+                else:
+                    r = await client.get("/api/search", params={"q": q})
+                latencies[kind].append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    errors[kind] += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s: {total / elapsed:.1f} req/s "
+          f"(docs={args.docs}, concurrency={args.concurrency})")
+    for kind, values in latencies.items():
+        print(f"  {kind:6s} n={len(values):5d} errors={errors[kind]:4d} "
+              f"p50={pct(values, 50) * 1000:7.1f}ms p95={pct(values, 95) * 1000:7.1f}ms "
+              f"p99={pct(values, 99) * 1000:7.1f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Mixed search/chat load test")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--chat-ratio", type=float, default=0.3)
+    parser.add_argument("--worker-latency", type=float, default=0.05, help="stub worker delay in seconds")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("DB_PATH", os.path.join(tmp, "loadtest.db"))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,268 +1,1122 @@
-# api/main.py
-from fastapi import FastAPI
-app = FastAPI()
+import os
+import json
+import sqlite3
+import time
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import hmac
+import itertools
+import secrets
+import threading
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, List
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+import artifact
+import cache
+import corpus
+import jobs
+import metrics
+import ranking
+import resilience
+
+# crawler/parsers (httpx, bs4, lxml), handler (httpx) and semantic (numpy) are
+# imported on the paths that use them, so a cold start serving searches from
+# the index artifact never loads them
+if TYPE_CHECKING:
+    import httpx
+    import semantic
+
+# Configuration via environment
+SCRAPER_BASE_URL = os.getenv("SCRAPER_BASE_URL", "https://www.europarl.europa.eu/committees/en/agri/documents/latest-documents")
+WORKER_URL = os.getenv("WORKER_URL")  # e.g. https://your-worker.domain
+WORKER_SHARED_SECRET = os.getenv("WORKER_SHARED_SECRET")
+TOP_K_DEFAULT = int(os.getenv("TOP_K_DEFAULT", "5"))
+DB_PATH = os.getenv("DB_PATH", "./agri_docs.db")
+HF_MODEL_DEFAULT = os.getenv("HF_MODEL_DEFAULT", "HuggingFaceTB/SmolLM3-3B:hf-inference")
+CRAWL_LIMIT = int(os.getenv("CRAWL_LIMIT", "200"))
+# BM25 column weights for the FTS index, same title/excerpt ratio as rank_results
+FTS_TITLE_WEIGHT = float(os.getenv("FTS_TITLE_WEIGHT", "100"))
+FTS_EXCERPT_WEIGHT = float(os.getenv("FTS_EXCERPT_WEIGHT", "50"))
+# fts: SQLite FTS5/BM25; memory: in-process engine with rank_results scoring
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "fts")
+SEMANTIC_INDEX_PATH = os.getenv("SEMANTIC_INDEX_PATH", DB_PATH + ".semantic.npz")
+SEMANTIC_NPROBE = int(os.getenv("SEMANTIC_NPROBE", "8"))
+CHAT_RETRIEVAL = os.getenv("CHAT_RETRIEVAL", "hybrid")  # hybrid | keyword
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))  # 0 disables the answer cache
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "500"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "2000"))  # 0 = unlimited
+CHAT_EXCERPT_MAX_CHARS = int(os.getenv("CHAT_EXCERPT_MAX_CHARS", "600"))
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "50"))
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))
+CRAWL_RATE_PER_HOST = float(os.getenv("CRAWL_RATE_PER_HOST", "5"))  # requests/second, 0 = unlimited
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "0"))  # politeness gap between requests to one host
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "3"))
+CRAWL_BACKOFF = float(os.getenv("CRAWL_BACKOFF", "0.5"))  # base of the jittered exponential retry delay
+DETAIL_MAX_BYTES = int(os.getenv("DETAIL_MAX_BYTES", "262144"))  # 0 = download detail pages in full
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INDEX_ARTIFACT = os.getenv("INDEX_ARTIFACT", artifact.DEFAULT_PATH)  # "" disables
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# committees to crawl, one SQLite shard each; listing URLs come from
+# SCRAPER_URL_TEMPLATE, by default SCRAPER_BASE_URL with "agri" swapped out
+COMMITTEES = [c.strip().lower() for c in os.getenv("COMMITTEES", "agri").split(",") if c.strip()] or ["agri"]
+SCRAPER_URL_TEMPLATE = os.getenv("SCRAPER_URL_TEMPLATE")
+LISTING_MAX_PAGES = int(os.getenv("LISTING_MAX_PAGES", "10"))  # listing pages followed per committee
+SHARD_QUERY_WORKERS = int(os.getenv("SHARD_QUERY_WORKERS", "4"))
+REINDEX_INTERVAL = float(os.getenv("REINDEX_INTERVAL", "0"))  # seconds between scheduled crawls, 0 = off
+CRAWL_ON_EMPTY_START = os.getenv("CRAWL_ON_EMPTY_START", "1") == "1"  # crawl at startup when every shard is empty
+WORKER_DEADLINE = float(os.getenv("WORKER_DEADLINE", "20"))  # end-to-end budget for one chat answer
+WORKER_RETRIES = int(os.getenv("WORKER_RETRIES", "2"))
+WORKER_RETRY_BACKOFF = float(os.getenv("WORKER_RETRY_BACKOFF", "0.25"))
+WORKER_ATTEMPT_TIMEOUT = float(os.getenv("WORKER_ATTEMPT_TIMEOUT", "0"))  # 0 = WORKER_DEADLINE / (retries + 1)
+WORKER_HEDGE_PERCENTILE = float(os.getenv("WORKER_HEDGE_PERCENTILE", "0"))  # e.g. 95; 0 = no hedging
+WORKER_BREAKER_FAILURES = int(os.getenv("WORKER_BREAKER_FAILURES", "5"))  # 0 disables the breaker
+WORKER_BREAKER_RESET = float(os.getenv("WORKER_BREAKER_RESET", "30"))
+WORKER_FALLBACK = os.getenv("WORKER_FALLBACK", "1") == "1"  # answer with ranked candidates when the worker is down
+
+if not WORKER_URL:
+    print("WORKER_URL not set, set it in Vercel env")
+
+app = FastAPI(title="AGRI documents search sqlite3")
+app.add_middleware(metrics.ServerTimingMiddleware)
+
+# Pydantic models
+class SearchResult(BaseModel):
+    title: str
+    url: str
+    doc_type: str | None = None
+    date: str | None = None
+    excerpt: str | None = None
+    committee: str | None = None
+
+class ChatRequest(BaseModel):
+    q: str
+    top_k: int | None = None
+    stream: bool = False
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    top_k: int | None = None
+    stream: bool = False
+
+# SQLite helpers
+# The corpus is sharded by committee: one SQLite file per committee, so each
+# shard stays small and searches fan out over all of them in parallel.
+# DB_PATH is the AGRI shard, the file the single-committee version wrote (or
+# a "{committee}" pattern); every other shard sits next to it as
+# <name>.<committee>.db. Files are named after their committee, never after
+# its position in COMMITTEES, so reordering the list can't file one
+# committee's rows under another. Each shard has one long-lived writer
+# connection in WAL mode: readers keep working while a crawl writes, and a
+# batch costs one transaction instead of one per document
+DB_PATH_COMMITTEE = "agri"
+PRIMARY_COMMITTEE = COMMITTEES[0]  # used by calls that don't name a committee
+
+def shard_file(path: str, committee: str) -> str:
+    if "{committee}" in path:
+        return path.format(committee=committee)
+    if committee == DB_PATH_COMMITTEE:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{committee}{ext}"
+
+def shard_path(committee: str | None = None) -> str:
+    return shard_file(DB_PATH, committee or PRIMARY_COMMITTEE)
+
+_writer_conns: dict[str, sqlite3.Connection] = {}
+_writer_lock = threading.Lock()
+
+def get_writer(committee: str | None = None) -> sqlite3.Connection:
+    committee = committee or PRIMARY_COMMITTEE
+    conn = _writer_conns.get(committee)
+    if conn is None:
+        conn = sqlite3.connect(shard_path(committee), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")
+        _writer_conns[committee] = conn
+    return conn
+
+def close_writer():
+    with _writer_lock:
+        for conn in _writer_conns.values():
+            conn.close()
+        _writer_conns.clear()
+
+# Reads run on a dedicated thread pool, each thread holding its own read-only
+# connection per shard, so endpoints never block the event loop on SQLite or
+# ranking. Shard queries of one search fan out on a second pool.
+_read_pool = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="sqlite-read")
+_shard_pool = ThreadPoolExecutor(max_workers=max(1, min(len(COMMITTEES), SHARD_QUERY_WORKERS)),
+                                 thread_name_prefix="sqlite-shard")
+_read_local = threading.local()
+# what readers open per shard: its file, or its index artifact until the first
+# write; bumping the epoch makes every reader thread reconnect on its next call
+_read_uris: dict[str, str] = {}
+_read_epoch = 0
+_artifact_meta: dict[str, dict] = {}  # committee -> metadata of the artifact being served
+
+def read_uri(committee: str) -> str:
+    return _read_uris.get(committee) or Path(shard_path(committee)).resolve().as_uri() + "?mode=ro"
+
+def get_reader(committee: str | None = None) -> sqlite3.Connection:
+    committee = committee or PRIMARY_COMMITTEE
+    pinned = getattr(_read_local, "pinned", None)
+    if pinned is not None:
+        # inside retrieve_candidates_batch: stay on the connections holding its
+        # read transactions, a new epoch is picked up once the batch commits
+        return pinned[committee]
+    if getattr(_read_local, "epoch", None) != _read_epoch:
+        for conn in getattr(_read_local, "conns", {}).values():
+            conn.close()
+        _read_local.conns, _read_local.epoch = {}, _read_epoch
+    conn = _read_local.conns.get(committee)
+    if conn is None:
+        conn = sqlite3.connect(read_uri(committee), uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        _read_local.conns[committee] = conn
+    return conn
+
+def artifact_path(committee: str) -> str:
+    return shard_file(INDEX_ARTIFACT, committee)
+
+def open_artifact() -> bool:
+    # A fresh instance (no shard file yet) serves the bundled artifact in place,
+    # read-only; ensure_db copies it to the shard file on the first write
+    global _read_epoch, FTS_ENABLED
+    for committee in COMMITTEES:
+        if os.path.exists(shard_path(committee)):
+            continue
+        path = artifact_path(committee)
+        meta = artifact.check(path)
+        if meta is None:
+            continue
+        _artifact_meta[committee] = meta
+        FTS_ENABLED = FTS_ENABLED and bool(meta.get("fts"))
+        _read_uris[committee] = artifact.uri(path)
+        print(f"Serving index artifact {path}: {meta.get('documents')} documents, built_at {meta.get('built_at')}")
+    _read_epoch += 1
+    return len(_artifact_meta) == len(COMMITTEES)
+
+def serving_artifact(committee: str | None = None) -> bool:
+    return committee in _artifact_meta if committee else bool(_artifact_meta)
+
+async def run_read(fn, *args):
+    # carry the request context so stage timings inside fn reach Server-Timing
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_read_pool, ctx.run, fn, *args)
+
+def ensure_db(committee: str | None = None):
+    global _read_epoch
+    for c in [committee] if committee else COMMITTEES:
+        with _writer_lock:
+            if serving_artifact(c) and not os.path.exists(shard_path(c)):
+                # copy-on-first-write: the artifact itself is never modified
+                shutil.copyfile(artifact_path(c), shard_path(c))
+            conn = get_writer(c)
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    url TEXT UNIQUE NOT NULL,
+                    doc_type TEXT,
+                    date TEXT,
+                    excerpt TEXT,
+                    indexed_at INTEGER,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT
+                )
+            """)
+            # databases created before incremental recrawl lack the validator columns
+            cols = {r[1] for r in cur.execute("PRAGMA table_info(documents)")}
+            for col in ("etag", "last_modified", "content_hash"):
+                if col not in cols:
+                    cur.execute(f"ALTER TABLE documents ADD COLUMN {col} TEXT")
+            ensure_fts(cur)
+            conn.commit()
+            if serving_artifact(c):
+                del _artifact_meta[c]
+                _read_uris.pop(c, None)
+                _read_epoch += 1
+
+# FTS5 index over title/excerpt, kept in sync with documents by triggers so
+# every write through upsert_document is reflected without a second statement
+FTS_ENABLED = True
+
+def ensure_fts(cur: sqlite3.Cursor):
+    global FTS_ENABLED
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='documents_fts'"
+    ).fetchone()
+    try:
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, excerpt,
+                content='documents', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print("FTS5 not available, falling back to full scan", e)
+        FTS_ENABLED = False
+        return
+    old_au = cur.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='documents_au'").fetchone()
+    if old_au and "UPDATE OF" not in old_au[0]:
+        # the first version fired on every column, so validator-only updates rewrote the FTS row
+        cur.execute("DROP TRIGGER documents_au")
+    cur.executescript("""
+        CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_fts(rowid, title, excerpt) VALUES (new.id, new.title, new.excerpt);
+        END;
+        CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, excerpt) VALUES ('delete', old.id, old.title, old.excerpt);
+        END;
+        CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE OF title, excerpt ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, excerpt) VALUES ('delete', old.id, old.title, old.excerpt);
+            INSERT INTO documents_fts(rowid, title, excerpt) VALUES (new.id, new.title, new.excerpt);
+        END;
+    """)
+    if not exists:
+        # index rows written before the FTS table existed
+        cur.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+
+UPSERT_SQL = """
+    INSERT INTO documents(title,url,doc_type,date,excerpt,indexed_at,etag,last_modified,content_hash)
+    VALUES(?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(url) DO UPDATE SET
+      title=excluded.title,
+      doc_type=excluded.doc_type,
+      date=excluded.date,
+      excerpt=excluded.excerpt,
+      indexed_at=excluded.indexed_at,
+      etag=excluded.etag,
+      last_modified=excluded.last_modified,
+      content_hash=excluded.content_hash
+"""
+
+def upsert_documents(batch: List[dict], committee: str | None = None):
+    if not batch:
+        return
+    now = int(time.time())
+    params = [
+        (d["title"], d["url"], d.get("doc_type"), d.get("date"), d.get("excerpt"), now,
+         d.get("etag"), d.get("last_modified"), d.get("content_hash"))
+        for d in batch
+    ]
+    with _writer_lock:
+        conn = get_writer(committee)
+        with conn:
+            conn.executemany(UPSERT_SQL, params)
+
+def touch_documents(batch: List[dict], committee: str | None = None):
+    # unchanged content: refresh the HTTP validators only, the FTS row stays put
+    if not batch:
+        return
+    params = [(d.get("etag"), d.get("last_modified"), d["url"]) for d in batch]
+    with _writer_lock:
+        conn = get_writer(committee)
+        with conn:
+            conn.executemany("UPDATE documents SET etag=?, last_modified=? WHERE url=?", params)
+
+def corpus_empty() -> bool:
+    return all(get_reader(c).execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None for c in COMMITTEES)
+
+def load_crawl_state(committee: str | None = None) -> dict:
+    cur = get_reader(committee).cursor()
+    cur.execute("SELECT url,etag,last_modified,content_hash FROM documents")
+    return {url: {"etag": etag, "last_modified": lm, "content_hash": h} for url, etag, lm, h in cur.fetchall()}
+
+def upsert_document(title: str, url: str, doc_type: str | None, date: str | None, excerpt: str | None):
+    upsert_documents([{"title": title, "url": url, "doc_type": doc_type, "date": date, "excerpt": excerpt}])
+
+def load_all_documents() -> List[dict]:
+    # every shard, newest first across committees
+    rows = []
+    for committee in COMMITTEES:
+        cur = get_reader(committee).cursor()
+        cur.execute("SELECT title,url,doc_type,date,excerpt,indexed_at FROM documents ORDER BY indexed_at DESC")
+        rows.extend({**r, "committee": committee} for r in map(dict, cur.fetchall()))
+    if len(COMMITTEES) > 1:
+        # a document listed by several committees (joint reports) has a row in
+        # each shard; the snapshot keeps the most recently indexed one
+        rows.sort(key=lambda r: -(r["indexed_at"] or 0))
+        rows = list(unique_by_url(rows))
+    for r in rows:
+        del r["indexed_at"]
+    return rows
+
+def unique_by_url(rows: Iterable[dict]) -> Iterator[dict]:
+    seen = set()
+    for r in rows:
+        if r["url"] not in seen:
+            seen.add(r["url"])
+            yield r
+
+# Corpus snapshot: rebuilt from SQLite after each crawl (and at startup for
+# the memory backend), then published with a single reference assignment so
+# readers never see a mix. FTS serving doesn't need the corpus in memory, so
+# there the first consumer (hybrid retrieval, /api/corpus) loads it instead
+# of the cold start.
+_snapshot: corpus.Snapshot | None = None
+_generation = 0  # bumped by every refresh; answer cache keys include it
+_snapshot_lock = asyncio.Lock()
+_snapshot_load_lock = threading.Lock()
+_engine: ranking.RankingEngine | None = None
+_engine_lock = threading.Lock()
+
+def current_generation() -> int:
+    return _generation
+
+def current_snapshot() -> corpus.Snapshot:
+    # blocks on SQLite the first time: call it on a reader thread
+    global _snapshot
+    snap = _snapshot
+    if snap is None:
+        with _snapshot_load_lock:
+            snap = _snapshot
+            if snap is None:
+                snap = _snapshot = corpus.build_snapshot(load_all_documents(), _generation)
+    return snap
+
+def memory_search_enabled() -> bool:
+    return SEARCH_BACKEND == "memory" or not FTS_ENABLED
+
+def get_engine(snapshot: corpus.Snapshot) -> ranking.RankingEngine:
+    global _engine
+    engine = _engine
+    if engine is None or engine.generation != snapshot.generation:
+        with _engine_lock:
+            engine = _engine
+            if engine is None or engine.generation != snapshot.generation:
+                engine = _engine = ranking.RankingEngine(snapshot)
+    return engine
+
+async def refresh_snapshot() -> corpus.Snapshot:
+    global _snapshot, _generation
+    async with _snapshot_lock:
+        rows = await run_read(load_all_documents)
+        snap = corpus.build_snapshot(rows, _generation + 1)
+        if memory_search_enabled():
+            # index before publishing so no request pays for the build
+            await asyncio.to_thread(get_engine, snap)
+        _snapshot, _generation = snap, snap.generation
+        answer_cache.clear()
+    stats = snap.stats()
+    print(f"Corpus snapshot generation {stats['generation']}: {stats['documents']} documents, "
+          f"{stats['bytes']} bytes ({stats['bytes_per_doc']} bytes/doc)")
+    return snap
+
+# Semantic index for chat candidates: rebuilt after each crawl, persisted next
+# to DB_PATH so a restart loads it instead of recomputing
+_semantic: "semantic.SemanticIndex | None" = None
+
+def semantic_index_path() -> str:
+    if serving_artifact() and not os.path.exists(SEMANTIC_INDEX_PATH):
+        return artifact.semantic_path(INDEX_ARTIFACT)
+    return SEMANTIC_INDEX_PATH
+
+def build_semantic_index(snapshot: corpus.Snapshot) -> "semantic.SemanticIndex":
+    import semantic
+
+    index = semantic.SemanticIndex.build(snapshot.docs)
+    index.save(SEMANTIC_INDEX_PATH)
+    return index
+
+async def refresh_semantic_index(snapshot: corpus.Snapshot | None = None, load: bool = False):
+    global _semantic
+    try:
+        path = semantic_index_path()
+        if load and os.path.exists(path):
+            import semantic
+
+            _semantic = await asyncio.to_thread(semantic.SemanticIndex.load, path)
+            return
+        snapshot = snapshot or await run_read(current_snapshot)
+        if len(snapshot):
+            _semantic = await asyncio.to_thread(build_semantic_index, snapshot)
+    except Exception as e:
+        print("Error building semantic index", e)
+
+class RetrievalView:
+    # the in-memory state one retrieval ranks against, captured together so a
+    # batch doesn't mix generations when a crawl swaps them mid-batch; the
+    # snapshot is only loaded when the memory engine or hybrid retrieval needs it
+    __slots__ = ("snapshot", "engine", "semantic")
+
+    def __init__(self):
+        self.semantic = _semantic if CHAT_RETRIEVAL == "hybrid" else None
+        memory = memory_search_enabled()
+        self.snapshot = current_snapshot() if memory or self.semantic is not None else None
+        self.engine = get_engine(self.snapshot) if memory else None
+
+def retrieve_candidates(q: str, top_k: int, view: RetrievalView | None = None) -> List[dict]:
+    view = view or RetrievalView()
+    with metrics.stage("search"):
+        keyword = search_documents(q, top_k * 2, view.engine)
+    index = view.semantic
+    if index is None:
+        return keyword[:top_k]
+    import semantic
+
+    with metrics.stage("semantic"):
+        hits = index.search(q, top_k * 2, nprobe=SEMANTIC_NPROBE)
+    by_url = {r["url"]: r for r in keyword}
+    docs = view.snapshot.by_url()
+    fused = semantic.reciprocal_rank_fusion([[r["url"] for r in keyword], [url for url, _ in hits]])
+    results = []
+    for url in fused:
+        if url in by_url:
+            results.append(by_url[url])
+        elif url in docs:
+            results.append(docs[url].to_dict())
+        if len(results) >= top_k:
+            break
+    return results
+
+def retrieve_candidates_batch(qs: List[str], top_k: int) -> List[List[dict] | Exception]:
+    # one read transaction per shard and one RetrievalView for the whole batch,
+    # so every question is ranked against the same committed state even if a
+    # crawl is writing; the shards are queried on this thread, inside those
+    # transactions. A question that fails gets its exception in its slot.
+    conns = {c: get_reader(c) for c in COMMITTEES}
+    for conn in conns.values():
+        conn.execute("BEGIN")
+    _read_local.pinned = conns
+    try:
+        view = RetrievalView()
+        ranked = []
+        for q in qs:
+            try:
+                ranked.append(retrieve_candidates(q, top_k, view))
+            except Exception as e:
+                ranked.append(e)
+        return ranked
+    finally:
+        _read_local.pinned = None
+        for conn in conns.values():
+            conn.execute("COMMIT")
+
+def fts_query(q: str) -> str:
+    # OR of prefix terms: approximates the substring match of rank_results
+    # ("agri" still hits "agriculture") while staying index-driven
+    terms = re.findall(r"\w+", q.lower())
+    return " OR ".join(f'"{t}"*' for t in dict.fromkeys(terms))
+
+def search_shard(committee: str, match: str, limit: int) -> List[tuple]:
+    # (bm25, -indexed_at, row) in rank order, for merging across shards
+    cur = get_reader(committee).cursor()
+    cur.execute("""
+        SELECT d.title, d.url, d.doc_type, d.date, d.excerpt,
+               bm25(documents_fts, ?, ?) AS score, d.indexed_at
+        FROM documents_fts
+        JOIN documents d ON d.id = documents_fts.rowid
+        WHERE documents_fts MATCH ?
+        ORDER BY score, d.indexed_at DESC
+        LIMIT ?
+    """, (FTS_TITLE_WEIGHT, FTS_EXCERPT_WEIGHT, match, limit))
+    return [(r["score"], -(r["indexed_at"] or 0),
+             {"title": r["title"], "url": r["url"], "doc_type": r["doc_type"], "date": r["date"],
+              "excerpt": r["excerpt"], "committee": committee})
+            for r in cur.fetchall()]
+
+def search_documents(q: str, limit: int, engine: ranking.RankingEngine | None = None) -> List[dict]:
+    if memory_search_enabled():
+        engine = engine or get_engine(current_snapshot())
+        return [d.to_dict() for d in engine.search(q, limit)]
+    match = fts_query(q)
+    if not match:
+        return []
+    if len(COMMITTEES) == 1:
+        return [row for _, _, row in search_shard(COMMITTEES[0], match, limit)]
+    # each shard returns its own top `limit`, the merge keeps the global top
+    # `limit`, counting a document found in several shards once at its best
+    # rank. bm25 statistics are per shard, so scores compare approximately.
+    if getattr(_read_local, "pinned", None) is not None:
+        per_shard = [search_shard(c, match, limit) for c in COMMITTEES]
+    else:
+        per_shard = list(_shard_pool.map(search_shard, COMMITTEES, [match] * len(COMMITTEES),
+                                         [limit] * len(COMMITTEES)))
+    merged = heapq.merge(*per_shard, key=lambda hit: hit[:2])
+    return list(itertools.islice(unique_by_url(row for _, _, row in merged), limit))
+
+# --- Scraper and parser
+# Parsing is CPU-bound: during a crawl it runs in a process pool so the event
+# loop keeps serving /api/search and /api/chat. PARSE_WORKERS=0 parses on a
+# thread instead (e.g. serverless runtimes without multiprocessing support).
+_parse_pool: ProcessPoolExecutor | None = None
+
+def get_parse_pool() -> ProcessPoolExecutor | None:
+    global _parse_pool
+    if _parse_pool is None and PARSE_WORKERS > 0:
+        try:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        except (OSError, NotImplementedError) as e:
+            print("Process pool unavailable, parsing on a thread", e)
+    return _parse_pool
+
+def close_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+async def run_parser(fn, *args):
+    pool = get_parse_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+def parse_listing(html: str) -> List[dict]:
+    import parsers
+
+    return parsers.parse_listing(html, SCRAPER_BASE_URL)
+
+def extract_detail(html: str) -> dict:
+    import parsers
+
+    return parsers.extract_detail(html)
+
+def conditional_headers(state: dict | None) -> dict:
+    headers = {}
+    if state:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+    return headers
+
+def listing_url(committee: str) -> str:
+    template = SCRAPER_URL_TEMPLATE or SCRAPER_BASE_URL.replace("/agri/", "/{committee}/")
+    return template.format(committee=committee)
+
+def error_summary(e: BaseException) -> str:
+    return str(e).splitlines()[0] if str(e) else type(e).__name__
+
+async def fetch_listing(client: "httpx.AsyncClient", limiter, committee: str, known: dict,
+                        new_only: bool, errors: List[str]) -> List[dict]:
+    # Follow the committee's listing pages until there is no "next" link,
+    # LISTING_MAX_PAGES pages or CRAWL_LIMIT documents. The listing is newest
+    # first, so new_only stops at the first URL already indexed. A page that
+    # fails after the first one ends the listing there: the documents found
+    # so far are kept and the error is appended to `errors`.
+    import crawler
+    import parsers
+
+    base_url = listing_url(committee)
+    url, pages = base_url, set()
+    items, seen = [], set()
+    while url and url not in pages and len(pages) < max(1, LISTING_MAX_PAGES):
+        pages.add(url)
+        try:
+            resp = await crawler.fetch_with_retry(client, url, limiter, CRAWL_RETRIES, CRAWL_BACKOFF, timeout=30)
+            resp.raise_for_status()
+            page, url = await run_parser(parsers.parse_listing_page, resp.text, base_url, url)
+        except Exception as e:
+            if not items:
+                raise
+            print("Error fetching listing page", url, e)
+            errors.append(f"{committee} page {len(pages)}: {error_summary(e)}")
+            return items
+        for item in page:
+            if item["url"] in seen:
+                continue
+            if new_only and item["url"] in known:
+                return items
+            seen.add(item["url"])
+            items.append({**item, "committee": committee})
+            if len(items) >= CRAWL_LIMIT:
+                return items
+    return items
+
+async def crawl_and_index(transport: "httpx.AsyncBaseTransport | None" = None, new_only: bool = False,
+                          progress: jobs.CrawlProgress | None = None):
+    import crawler
+    import parsers
+
+    progress = progress or jobs.CrawlProgress(new_only)
+    ensure_db()
+    known = {c: await run_read(load_crawl_state, c) for c in COMMITTEES}
+    limiter = crawler.HostRateLimiter(CRAWL_RATE_PER_HOST, CRAWL_DELAY)
+    async with crawler.make_client(CRAWL_WORKERS, transport=transport) as client:
+        # committees' listings are paged through concurrently, then every
+        # document goes through one shared worker pool
+        errors: List[str] = []
+        listings = await asyncio.gather(*(fetch_listing(client, limiter, c, known[c], new_only, errors)
+                                          for c in COMMITTEES), return_exceptions=True)
+        listing, failed = [], 0
+        for committee, result in zip(COMMITTEES, listings):
+            if isinstance(result, BaseException):
+                print("Error fetching listing", committee, result)
+                errors.append(f"{committee}: {error_summary(result)}")
+                failed += 1
+            else:
+                listing.extend(result)
+        if errors:
+            progress.error = "listing " + "; ".join(errors)
+        if failed == len(COMMITTEES):
+            return
+        progress.listed = len(listing)
+        batches: dict[str, list] = {c: [] for c in COMMITTEES}
+        unchanged: dict[str, list] = {c: [] for c in COMMITTEES}
+
+        async def handle(item: dict, r: "httpx.Response | None", error: Exception | None):
+            committee = item["committee"]
+            if error is not None:
+                print("Error indexing", item.get("url"), error)
+                progress.failed += 1
+                return
+            progress.fetched += 1
+            state = known[committee].get(item["url"]) or {}
+            try:
+                if r.status_code == 304:
+                    progress.skipped += 1
+                    return
+                validators = {"etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified")}
+                if r.status_code != 200:
+                    progress.failed += 1
+                    if state:
+                        # keep what a previous crawl indexed rather than blanking it
+                        return
+                    row = {"title": item["title"], "url": item["url"], "date": None, "excerpt": None, "doc_type": None}
+                elif r.request.method == "HEAD" or not crawler.is_text_response(r):
+                    # binary document: index the listing title, keep validators for the next HEAD
+                    if state and all(state.get(k) == v for k, v in validators.items()):
+                        progress.skipped += 1
+                        return
+                    row = {"title": item["title"], "url": item["url"], "date": None, "excerpt": None,
+                           "doc_type": None, **validators}
+                else:
+                    content_hash = hashlib.sha256(r.content).hexdigest()
+                    if content_hash == state.get("content_hash"):
+                        unchanged[committee].append({"url": item["url"], **validators})
+                        progress.skipped += 1
+                        return
+                    with metrics.stage("crawl_parse"):
+                        detail = await run_parser(parsers.extract_detail, r.text)
+                    progress.parsed += 1
+                    row = {"title": detail.get("title") or item["title"], "url": item["url"],
+                           "doc_type": detail.get("doc_type"), "date": detail.get("date"),
+                           "excerpt": detail.get("excerpt"), "content_hash": content_hash, **validators}
+                # looked up after the awaits above: a flush may have swapped the list
+                batches[committee].append(row)
+            except Exception as e:
+                print("Error indexing", item.get("url"), e)
+                progress.failed += 1
+                return
+            if len(batches[committee]) >= UPSERT_BATCH_SIZE:
+                to_write, batches[committee] = batches[committee], []
+                with metrics.stage("crawl_upsert"):
+                    await asyncio.to_thread(upsert_documents, to_write, committee)
+                progress.upserted += len(to_write)
+
+        await crawler.crawl(client, listing, handle, workers=CRAWL_WORKERS, limiter=limiter, retries=CRAWL_RETRIES,
+                            backoff=CRAWL_BACKOFF, max_bytes=DETAIL_MAX_BYTES, is_complete=parsers.detail_complete,
+                            headers_for=lambda item: conditional_headers(known[item["committee"]].get(item["url"])))
+        with metrics.stage("crawl_upsert"):
+            for committee in COMMITTEES:
+                await asyncio.to_thread(upsert_documents, batches[committee], committee)
+                await asyncio.to_thread(touch_documents, unchanged[committee], committee)
+                progress.upserted += len(batches[committee])
+    if not progress.upserted:
+        # nothing changed: the snapshot, cached answers and semantic index are still current
+        return
+    snapshot = await refresh_snapshot()
+    await refresh_semantic_index(snapshot)
+
+# --- Search and ranking
+# Reference scoring; the serving path uses ranking.RankingEngine, which must
+# return the same results
+def rank_results(rows: List[dict], q: str) -> List[dict]:
+    ql = q.lower()
+    scored = []
+    for r in rows:
+        score = 0
+        title = (r.get("title") or "").lower()
+        excerpt = (r.get("excerpt") or "").lower()
+        if ql in title:
+            score += 100
+        if ql in excerpt:
+            score += 50
+        overlap = sum(1 for t in ql.split() if t and (t in title or t in excerpt))
+        score += overlap * 10
+        scored.append((score, r))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [r for s, r in scored if s > 0]
+
+# --- Chat prompt and worker forwarding
+SYSTEM_INSTRUCT = (
+    "You are a search assistant that only uses European Parliament AGRI committee documents provided in the context. "
+    "You must not invent or infer document titles or links. If the supplied candidate list contains relevant documents, "
+    "produce a concise answer that references only those documents by exact title and URL. If none match, reply exactly: "
+    "'I can only search AGRI committee documents; no matching documents found.' Output must be a JSON array of matches: "
+    '[{\"title\":\"...\",\"url\":\"...\",\"snippet\":\"...\",\"matched_terms\":\"...\"}].'
+)
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for BPE tokenizers on English/European text;
+    # close enough for budgeting and O(1) instead of running a tokenizer
+    return (len(text) + 3) // 4
+
+def trim_excerpt(excerpt: str, terms: List[str], max_chars: int) -> str:
+    # keep a max_chars window around the first matched query term
+    if len(excerpt) <= max_chars:
+        return excerpt
+    lower = excerpt.lower()
+    hits = [i for i in (lower.find(t) for t in terms) if i >= 0]
+    center = min(hits) if hits else 0
+    start = max(0, min(center - max_chars // 3, len(excerpt) - max_chars))
+    window = excerpt[start:start + max_chars].strip()
+    return ("…" if start > 0 else "") + window + ("…" if start + max_chars < len(excerpt) else "")
+
+def build_messages(q: str, candidates: List[dict], budget: int | None = None) -> tuple[List[dict], str, dict]:
+    # Build strict prompt as in earlier scaffold, within a token budget:
+    # excerpts are trimmed around matched terms, and once a candidate no
+    # longer fits it and every lower-ranked one are dropped
+    budget = CHAT_PROMPT_TOKEN_BUDGET if budget is None else budget
+    terms = [t for t in re.findall(r"\w+", q.lower()) if len(t) > 2]
+    header = "Candidate documents (do not alter):\n"
+    user_block = f"User question: {q}\nTask: Return a JSON array of matching documents from the candidate list only. If no candidate matches, return the single-string refusal above."
+    used = estimate_tokens(SYSTEM_INSTRUCT) + estimate_tokens(header) + estimate_tokens(user_block)
+
+    cand_lines = []
+    for c in candidates:
+        title = c.get("title") or ""
+        url = c.get("url") or ""
+        excerpt = trim_excerpt(c.get("excerpt") or "", terms, CHAT_EXCERPT_MAX_CHARS)
+        line = f"{len(cand_lines) + 1}) Title: {title}\n   URL: {url}\n   Excerpt: {excerpt}"
+        cost = estimate_tokens(line) + 1
+        if budget and used + cost > budget:
+            # last try: this candidate without most of its excerpt
+            spare = (budget - used - estimate_tokens(line[:len(line) - len(excerpt)]) - 1) * 4
+            if spare < 80:
+                break
+            line = line[:len(line) - len(excerpt)] + trim_excerpt(excerpt, terms, spare)
+            cost = estimate_tokens(line) + 1
+        cand_lines.append(line)
+        used += cost
+    candidate_block = "\n".join(cand_lines) if cand_lines else "No candidates available."
+    if not cand_lines:
+        used += estimate_tokens(candidate_block)
+
+    messages = [
+        {"role": "system", "content": SYSTEM_INSTRUCT},
+        {"role": "system", "content": header + candidate_block},
+        {"role": "user", "content": user_block}
+    ]
+    stats = {"tokens_estimate": used, "budget": budget, "candidates": len(cand_lines),
+             "dropped": len(candidates) - len(cand_lines)}
+    return messages, candidate_block, stats
+
+def sign_envelope(payload: dict) -> tuple[bytes, dict]:
+    with metrics.stage("sign"):
+        return _sign_envelope(payload)
+
+def _sign_envelope(payload: dict) -> tuple[bytes, dict]:
+    # Add envelope with timestamp and nonce then compute HMAC
+    envelope = payload.copy()
+    envelope["timestamp"] = int(time.time())
+    # generate short nonce
+    envelope["nonce"] = secrets.token_hex(8)
+
+    # Create signature
+    raw = json.dumps(envelope, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    mac = hmac.new(WORKER_SHARED_SECRET.encode("utf-8"), raw, hashlib.sha256).hexdigest()
+    sig = f"sha256={mac}"
+    return raw, {"Content-Type": "application/json", "X-Signature": sig}
+
+# Worker calls share one deadline, retry transient failures with a freshly
+# signed envelope, optionally hedge slow attempts, and fail fast while the
+# breaker is open
+WORKER_RETRY_STATUSES = {429, 500, 502, 503, 504}
+worker_breaker = resilience.CircuitBreaker(WORKER_BREAKER_FAILURES, WORKER_BREAKER_RESET)
+worker_latency = resilience.LatencyTracker()
+worker_stats = {"attempts": 0, "hedges": 0, "fallbacks": 0}
+
+def worker_retryable(e: BaseException) -> bool:
+    import httpx
+
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in WORKER_RETRY_STATUSES
+    return isinstance(e, (httpx.TimeoutException, httpx.TransportError))
+
+def worker_error(e: Exception) -> HTTPException:
+    import httpx
+
+    if isinstance(e, httpx.HTTPStatusError):
+        return HTTPException(status_code=502, detail=f"Worker error: {e.response.status_code} {e.response.text}")
+    return HTTPException(status_code=502, detail=str(e))
+
+async def call_worker(attempt, hedge: bool = True):
+    try:
+        return await resilience.call(attempt, deadline=WORKER_DEADLINE, retries=WORKER_RETRIES,
+                                     backoff=WORKER_RETRY_BACKOFF, retryable=worker_retryable,
+                                     breaker=worker_breaker, latency=worker_latency,
+                                     hedge_percentile=WORKER_HEDGE_PERCENTILE if hedge else 0,
+                                     attempt_timeout=WORKER_ATTEMPT_TIMEOUT, stats=worker_stats)
+    except resilience.Unavailable as e:
+        if not WORKER_FALLBACK:
+            raise HTTPException(status_code=503, detail=f"Worker unavailable: {e}")
+        raise
+
+async def forward_to_worker(payload: dict) -> dict:
+    import handler
+
+    async def attempt(timeout: float) -> dict:
+        raw, headers = sign_envelope(payload)
+        resp = await handler.get_client().post(f"{WORKER_URL}/chat", content=raw, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    try:
+        with metrics.stage("worker"):
+            return await call_worker(attempt)
+    except (HTTPException, resilience.Unavailable):
+        raise
+    except Exception as e:
+        raise worker_error(e)
+
+def fallback_answer(candidates: List[dict], prompt_stats: dict | None, reason: str) -> dict:
+    # no LLM answer: the ranked candidates are still a useful response
+    worker_stats["fallbacks"] += 1
+    return {"ok": True, "worker": None, "fallback": True, "reason": reason,
+            "candidates": candidates, "prompt": prompt_stats}
+
+async def stream_from_worker(payload: dict, candidates: List[dict]) -> StreamingResponse:
+    # Same signed envelope with "stream": true; the worker's SSE body is relayed
+    # chunk by chunk. Retries and the breaker cover the call up to the response
+    # headers; nothing is retried once bytes have been sent. With the worker
+    # down the stream is a single "fallback" event carrying the candidates.
+    import handler
+
+    client = handler.get_client()
+
+    async def attempt(timeout: float):
+        raw, headers = sign_envelope({**payload, "stream": True})
+        req = client.build_request("POST", f"{WORKER_URL}/chat", content=raw, headers=headers, timeout=timeout)
+        resp = await client.send(req, stream=True)
+        if resp.status_code >= 400:
+            await resp.aread()
+            await resp.aclose()
+            resp.raise_for_status()
+        return resp
+
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    try:
+        with metrics.stage("worker_first_byte"):
+            # hedging would leave a second stream to tear down, so it is not used here
+            resp = await call_worker(attempt, hedge=False)
+    except resilience.Unavailable as e:
+        event = json.dumps(fallback_answer(candidates, None, str(e)), ensure_ascii=False)
+
+        async def fallback():
+            yield f"event: fallback\ndata: {event}\n\n"
+
+        return StreamingResponse(fallback(), media_type="text/event-stream", headers=sse_headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise worker_error(e)
+
+    async def relay():
+        try:
+            async for chunk in resp.aiter_bytes():
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    # relay()'s finally never runs if the client disconnects while it is parked
+    # at a yield; the background task closes the upstream response either way
+    return StreamingResponse(relay(), media_type="text/event-stream", headers=sse_headers,
+                             background=BackgroundTask(resp.aclose))
+
+# Answers are cached per (normalized question, top_k, model, corpus generation,
+# candidate block hash); concurrent identical questions share one worker call
+answer_cache = cache.AnswerCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL)
+
+def answer_cache_key(q: str, top_k: int, generation: int, candidate_block: str) -> tuple:
+    normalized = " ".join(q.lower().split())
+    block_hash = hashlib.sha256(candidate_block.encode("utf-8")).hexdigest()
+    return (normalized, top_k, HF_MODEL_DEFAULT, generation, block_hash)
+
+# One crawl at a time; /api/reindex calls during a crawl are coalesced
+reindex_jobs = jobs.JobRunner(crawl_and_index)
+
+# --- FastAPI endpoints
+@app.on_event("startup")
+async def startup():
+    open_artifact()
+    for committee in COMMITTEES:
+        if not serving_artifact(committee):
+            ensure_db(committee)
+    if memory_search_enabled():
+        await refresh_snapshot()
+    asyncio.create_task(refresh_semantic_index(load=True))
+    if CRAWL_ON_EMPTY_START and await run_read(corpus_empty):
+        # no artifact and nothing crawled yet: fill the index in the background
+        # instead of waiting for a scheduled or manual reindex
+        reindex_jobs.start()
+    reindex_jobs.schedule(REINDEX_INTERVAL)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await reindex_jobs.close()
+    close_writer()
+    close_parse_pool()
+    _shard_pool.shutdown(wait=False)
+    handler = sys.modules.get("handler")
+    if handler is not None:
+        await handler.close_client()
+    _read_pool.shutdown(wait=False)
+
+@app.get("/api/search", response_model=List[SearchResult])
+async def api_search(q: str):
+    if not q:
+        raise HTTPException(status_code=400, detail="q query parameter required")
+    with metrics.stage("retrieve"):
+        return await run_read(search_documents, q, TOP_K_DEFAULT)
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def api_metrics():
+    cache_stats = answer_cache.stats()
+    extra = ["# TYPE aimend_corpus_generation gauge", f"aimend_corpus_generation {current_generation()}"]
+    if _snapshot is not None:
+        # a scrape must not load the corpus the FTS path left on disk
+        snap = _snapshot.stats()
+        extra += ["# TYPE aimend_corpus_documents gauge", f"aimend_corpus_documents {snap['documents']}",
+                  "# TYPE aimend_corpus_bytes gauge", f"aimend_corpus_bytes {snap['bytes']}"]
+    for name in ("hits", "misses", "coalesced", "evictions"):
+        extra += [f"# TYPE aimend_answer_cache_{name}_total counter", f"aimend_answer_cache_{name}_total {cache_stats[name]}"]
+    extra += ["# TYPE aimend_answer_cache_entries gauge", f"aimend_answer_cache_entries {cache_stats['entries']}"]
+    for name in ("attempts", "hedges", "fallbacks"):
+        extra += [f"# TYPE aimend_worker_{name}_total counter", f"aimend_worker_{name}_total {worker_stats[name]}"]
+    breaker = worker_breaker.stats()
+    extra += ["# TYPE aimend_worker_circuit_open gauge", f"aimend_worker_circuit_open {int(breaker['state'] != 'closed')}",
+              "# TYPE aimend_worker_circuit_trips_total counter", f"aimend_worker_circuit_trips_total {breaker['trips']}",
+              "# TYPE aimend_worker_circuit_rejected_total counter", f"aimend_worker_circuit_rejected_total {breaker['rejected']}"]
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/corpus")
+async def api_corpus():
+    return {**(await run_read(current_snapshot)).stats(), "committees": COMMITTEES,
+            "source": "artifact" if serving_artifact() else "database", "artifact": _artifact_meta or None}
+
+@app.post("/api/reindex")
+async def api_reindex(new_only: bool = False):
+    if reindex_jobs.start(new_only):
+        return {"ok": True, "message": "Reindex started", "status": reindex_jobs.status()}
+    return {"ok": True, "message": "Reindex already running, queued one follow-up run",
+            "status": reindex_jobs.status()}
+
+@app.get("/api/reindex/status")
+async def api_reindex_status():
+    return reindex_jobs.status()
+
+@app.post("/api/reindex/cancel")
+async def api_reindex_cancel():
+    return {"ok": True, "cancelled": reindex_jobs.cancel(), "status": reindex_jobs.status()}
+
+def check_worker_config():
+    # sign and forward to Worker using WORKER_SHARED_SECRET
+    # Vercel must set WORKER_SHARED_SECRET and WORKER_URL env vars
+    if not WORKER_SHARED_SECRET:
+        raise HTTPException(status_code=500, detail="WORKER_SHARED_SECRET not configured in environment")
+
+async def answer_question(q: str, top_k: int, candidates: List[dict], generation: int) -> dict:
+    with metrics.stage("prompt"):
+        messages, candidate_block, prompt_stats = build_messages(q, candidates)
+    payload = {"model": HF_MODEL_DEFAULT, "messages": messages, "stream": False}
+    key = answer_cache_key(q, top_k, generation, candidate_block)
+    try:
+        data = await answer_cache.get_or_compute(key, lambda: forward_to_worker(payload))
+    except resilience.Unavailable as e:
+        # raised out of the cache, so fallbacks are never cached
+        return fallback_answer(candidates, prompt_stats, str(e))
+    return {"ok": True, "worker": data, "prompt": prompt_stats}
 
 @app.post("/api/chat")
-async def chat(payload: dict):
-    q = payload.get("q")
-    return {"q": q, "answer": "hello from Vercel Python"}
-
-
-# import os
-# import json
-# import sqlite3
-# import time
-# import asyncio
-# from datetime import datetime
-# from typing import List
-
-# import httpx
-# from bs4 import BeautifulSoup
-# from fastapi import FastAPI, HTTPException, BackgroundTasks
-# from pydantic import BaseModel
-
-# # Configuration via environment
-# SCRAPER_BASE_URL = os.getenv("SCRAPER_BASE_URL", "https://www.europarl.europa.eu/committees/en/agri/documents/latest-documents")
-# WORKER_URL = os.getenv("WORKER_URL")  # e.g. https://your-worker.domain
-# WORKER_SHARED_SECRET = os.getenv("WORKER_SHARED_SECRET")
-# TOP_K_DEFAULT = int(os.getenv("TOP_K_DEFAULT", "5"))
-# DB_PATH = os.getenv("DB_PATH", "./agri_docs.db")
-# HF_MODEL_DEFAULT = os.getenv("HF_MODEL_DEFAULT", "HuggingFaceTB/SmolLM3-3B:hf-inference")
-# CRAWL_LIMIT = int(os.getenv("CRAWL_LIMIT", "200"))
-
-# if not WORKER_URL:
-#     print("WORKER_URL not set, set it in Vercel env")
-
-# app = FastAPI(title="AGRI documents search sqlite3")
-
-# # Pydantic models
-# class SearchResult(BaseModel):
-#     title: str
-#     url: str
-#     doc_type: str | None = None
-#     date: str | None = None
-#     excerpt: str | None = None
-
-# class ChatRequest(BaseModel):
-#     q: str
-#     top_k: int | None = None
-
-# # SQLite helpers
-# def ensure_db():
-#     conn = sqlite3.connect(DB_PATH)
-#     try:
-#         cur = conn.cursor()
-#         cur.execute("""
-#             CREATE TABLE IF NOT EXISTS documents (
-#                 id INTEGER PRIMARY KEY,
-#                 title TEXT NOT NULL,
-#                 url TEXT UNIQUE NOT NULL,
-#                 doc_type TEXT,
-#                 date TEXT,
-#                 excerpt TEXT,
-#                 indexed_at INTEGER
-#             )
-#         """)
-#         conn.commit()
-#     finally:
-#         conn.close()
-
-# def upsert_document(title: str, url: str, doc_type: str | None, date: str | None, excerpt: str | None):
-#     conn = sqlite3.connect(DB_PATH)
-#     try:
-#         cur = conn.cursor()
-#         now = int(time.time())
-#         cur.execute("""
-#             INSERT INTO documents(title,url,doc_type,date,excerpt,indexed_at)
-#             VALUES(?,?,?,?,?,?)
-#             ON CONFLICT(url) DO UPDATE SET
-#               title=excluded.title,
-#               doc_type=excluded.doc_type,
-#               date=excluded.date,
-#               excerpt=excluded.excerpt,
-#               indexed_at=excluded.indexed_at
-#         """, (title, url, doc_type, date, excerpt, now))
-#         conn.commit()
-#     finally:
-#         conn.close()
-
-# def load_all_documents() -> List[dict]:
-#     conn = sqlite3.connect(DB_PATH)
-#     conn.row_factory = sqlite3.Row
-#     try:
-#         cur = conn.cursor()
-#         cur.execute("SELECT title,url,doc_type,date,excerpt FROM documents ORDER BY indexed_at DESC")
-#         rows = cur.fetchall()
-#         return [dict(r) for r in rows]
-#     finally:
-#         conn.close()
-
-# # --- Scraper and parser
-# def parse_listing(html: str) -> List[dict]:
-#     soup = BeautifulSoup(html, "html.parser")
-#     results = []
-#     # Generic heuristics for links
-#     for a in soup.select("a"):
-#         href = a.get("href")
-#         if not href:
-#             continue
-#         text = a.get_text(strip=True)
-#         if not text:
-#             continue
-#         # accept links to document pages containing '/documents/' or '/_'
-#         if "/documents/" in href or "/doceo/" in href or href.endswith(".pdf"):
-#             if href.startswith("/"):
-#                 url = "https://www.europarl.europa.eu" + href
-#             elif href.startswith("http"):
-#                 url = href
-#             else:
-#                 url = SCRAPER_BASE_URL.rstrip("/") + "/" + href
-#             results.append({"title": text, "url": url})
-#     # dedupe preserving order
-#     seen = set()
-#     dedup = []
-#     for r in results:
-#         if r["url"] in seen: continue
-#         seen.add(r["url"])
-#         dedup.append(r)
-#     return dedup
-
-# def extract_detail(html: str) -> dict:
-#     soup = BeautifulSoup(html, "html.parser")
-#     title_tag = soup.select_one("h1, h2, .ep_title, .documentTitle")
-#     title = title_tag.get_text(strip=True) if title_tag else ""
-#     date_tag = soup.select_one(".date, .ep_date, time")
-#     date = date_tag.get_text(strip=True) if date_tag else ""
-#     p = soup.select_one("p, .summary, .ep_summary")
-#     excerpt = p.get_text(strip=True) if p else ""
-#     dtype = ""
-#     dtype_tag = soup.find(string=lambda s: s and ("Opinion" in s or "Report" in s or "Amendment" in s))
-#     if dtype_tag:
-#         dtype = dtype_tag.strip()
-#     return {"title": title, "date": date, "excerpt": excerpt, "doc_type": dtype}
-
-# async def crawl_and_index():
-#     ensure_db()
-#     async with httpx.AsyncClient(timeout=30) as client:
-#         try:
-#             listing_resp = await client.get(SCRAPER_BASE_URL)
-#             listing_resp.raise_for_status()
-#         except Exception as e:
-#             print("Error fetching listing", e)
-#             return
-#         listing = parse_listing(listing_resp.text)
-#         for item in listing[:CRAWL_LIMIT]:
-#             try:
-#                 r = await client.get(item["url"], timeout=20)
-#                 if r.status_code != 200:
-#                     detail = {"title": item["title"], "date": None, "excerpt": None, "doc_type": None}
-#                 else:
-#                     detail = extract_detail(r.text)
-#                 title = detail.get("title") or item["title"]
-#                 upsert_document(title, item["url"], detail.get("doc_type"), detail.get("date"), detail.get("excerpt"))
-#             except Exception as e:
-#                 print("Error indexing", item.get("url"), e)
-#                 continue
-
-# # --- Search and ranking
-# def rank_results(rows: List[dict], q: str) -> List[dict]:
-#     ql = q.lower()
-#     scored = []
-#     for r in rows:
-#         score = 0
-#         title = (r.get("title") or "").lower()
-#         excerpt = (r.get("excerpt") or "").lower()
-#         if ql in title:
-#             score += 100
-#         if ql in excerpt:
-#             score += 50
-#         overlap = sum(1 for t in ql.split() if t and (t in title or t in excerpt))
-#         score += overlap * 10
-#         scored.append((score, r))
-#     scored.sort(key=lambda x: x[0], reverse=True)
-#     return [r for s, r in scored if s > 0]
-
-# # --- FastAPI endpoints
-# @app.on_event("startup")
-# async def startup():
-#     ensure_db()
-
-# @app.get("/api/search", response_model=List[SearchResult])
-# async def api_search(q: str):
-#     if not q:
-#         raise HTTPException(status_code=400, detail="q query parameter required")
-#     rows = load_all_documents()
-#     ranked = rank_results(rows, q)
-#     return ranked[:TOP_K_DEFAULT]
-
-# @app.post("/api/reindex")
-# async def api_reindex(background_tasks: BackgroundTasks):
-#     background_tasks.add_task(crawl_and_index)
-#     return {"ok": True, "message": "Reindex scheduled"}
-
-# @app.post("/api/chat")
-# async def api_chat(req: ChatRequest):
-#     q = req.q.strip()
-#     if not q:
-#         raise HTTPException(status_code=400, detail="q required")
-#     top_k = req.top_k or TOP_K_DEFAULT
-#     rows = load_all_documents()
-#     candidates = rank_results(rows, q)[:top_k]
-
-#     # Build strict prompt as in earlier scaffold
-#     system_instruct = (
-#         "You are a search assistant that only uses European Parliament AGRI committee documents provided in the context. "
-#         "You must not invent or infer document titles or links. If the supplied candidate list contains relevant documents, "
-#         "produce a concise answer that references only those documents by exact title and URL. If none match, reply exactly: "
-#         "'I can only search AGRI committee documents; no matching documents found.' Output must be a JSON array of matches: "
-#         '[{\"title\":\"...\",\"url\":\"...\",\"snippet\":\"...\",\"matched_terms\":\"...\"}].'
-#     )
-
-#     cand_lines = []
-#     for i, c in enumerate(candidates, start=1):
-#         title = c.get("title") or ""
-#         url = c.get("url") or ""
-#         excerpt = c.get("excerpt") or ""
-#         cand_lines.append(f"{i}) Title: {title}\n   URL: {url}\n   Excerpt: {excerpt}")
-#     candidate_block = "\n".join(cand_lines) if cand_lines else "No candidates available."
-
-#     user_block = f"User question: {q}\nTask: Return a JSON array of matching documents from the candidate list only. If no candidate matches, return the single-string refusal above."
-
-#     messages = [
-#         {"role": "system", "content": system_instruct},
-#         {"role": "system", "content": "Candidate documents (do not alter):\n" + candidate_block},
-#         {"role": "user", "content": user_block}
-#     ]
-
-#     payload = {"model": HF_MODEL_DEFAULT, "messages": messages, "stream": False}
-
-#     # sign and forward to Worker using WORKER_SHARED_SECRET
-#     # Vercel must set WORKER_SHARED_SECRET and WORKER_URL env vars
-#     if not WORKER_SHARED_SECRET:
-#         raise HTTPException(status_code=500, detail="WORKER_SHARED_SECRET not configured in environment")
-
-#     # Add envelope with timestamp and nonce then compute HMAC
-#     envelope = payload.copy()
-#     envelope["timestamp"] = int(time.time())
-#     # generate short nonce
-#     import secrets
-#     envelope["nonce"] = secrets.token_hex(8)
-
-#     # Create signature
-#     import hmac, hashlib
-#     raw = json.dumps(envelope, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
-#     mac = hmac.new(WORKER_SHARED_SECRET.encode("utf-8"), raw, hashlib.sha256).hexdigest()
-#     sig = f"sha256={mac}"
-
-#     headers = {"Content-Type": "application/json", "X-Signature": sig}
-#     async with httpx.AsyncClient(timeout=30) as client:
-#         try:
-#             resp = await client.post(f"{WORKER_URL}/chat", content=raw, headers=headers)
-#             resp.raise_for_status()
-#             data = resp.json()
-#             return {"ok": True, "worker": data}
-#         except httpx.HTTPStatusError as e:
-#             text = e.response.text if e.response else ""
-#             raise HTTPException(status_code=502, detail=f"Worker error: {e.response.status_code} {text}")
-#         except Exception as e:
-#             raise HTTPException(status_code=502, detail=str(e))
+async def api_chat(req: ChatRequest):
+    q = req.q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q required")
+    top_k = req.top_k or TOP_K_DEFAULT
+    generation = current_generation()
+    with metrics.stage("retrieve"):
+        candidates = await run_read(retrieve_candidates, q, top_k)
+    check_worker_config()
+
+    if req.stream:
+        # streamed answers bypass the answer cache
+        messages, _, prompt_stats = build_messages(q, candidates)
+        response = await stream_from_worker({"model": HF_MODEL_DEFAULT, "messages": messages, "stream": True},
+                                            candidates)
+        response.headers["X-Prompt-Tokens"] = str(prompt_stats["tokens_estimate"])
+        return response
+
+    return await answer_question(q, top_k, candidates, generation)
+
+@app.post("/api/chat/batch")
+async def api_chat_batch(req: BatchChatRequest):
+    qs = [q.strip() for q in req.questions]
+    if not qs:
+        raise HTTPException(status_code=400, detail="questions required")
+    if len(qs) > CHAT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {CHAT_BATCH_MAX} questions per batch")
+    check_worker_config()
+    top_k = req.top_k or TOP_K_DEFAULT
+    generation = current_generation()
+    ranked = await run_read(retrieve_candidates_batch, qs, top_k)
+    sem = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+    async def run_one(i: int) -> dict:
+        # per-item isolation: a failure becomes that item's result
+        q = qs[i]
+        if not q:
+            return {"index": i, "q": q, "ok": False, "error": "q required"}
+        if isinstance(ranked[i], Exception):
+            return {"index": i, "q": q, "ok": False, "error": f"retrieval failed: {ranked[i]}"}
+        async with sem:
+            try:
+                return {"index": i, "q": q, **await answer_question(q, top_k, ranked[i], generation)}
+            except HTTPException as e:
+                return {"index": i, "q": q, "ok": False, "error": e.detail}
+            except Exception as e:
+                return {"index": i, "q": q, "ok": False, "error": str(e)}
+
+    tasks = [asyncio.create_task(run_one(i)) for i in range(len(qs))]
+    if not req.stream:
+        return {"ok": True, "results": await asyncio.gather(*tasks)}
+
+    async def ndjson():
+        # one JSON line per question, in completion order
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done, ensure_ascii=False) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/api/chat/cache")
+async def api_chat_cache():
+    return answer_cache.stats()
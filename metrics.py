@@ -0,0 +1,169 @@
+# metrics.py
+# Per-stage timers, Prometheus-text histograms and Server-Timing headers.
+#
+#   with metrics.stage("sign"):
+#       ...
+#
+# records into the aimend_stage_seconds histogram and, inside a request, into
+# that request's Server-Timing header (ServerTimingMiddleware). With
+# METRICS_ENABLED=0 stage() hands back a shared no-op and the middleware is a
+# pass-through. PROFILE_SAMPLE_RATE > 0 runs that fraction of requests under
+# cProfile and hands the profile to profile_hook (default: dump to PROFILE_DIR);
+# at most one profile is active at a time.
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from typing import Callable
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_timings: contextvars.ContextVar[list | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label: str, buckets=BUCKETS):
+        self.name, self.help, self.label, self.buckets = name, help, label, buckets
+        self._series: dict[str, list] = {}  # label value -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for value, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-1]:.6f}')
+        return lines
+
+
+stage_seconds = Histogram("aimend_stage_seconds", "Time spent per processing stage", "stage")
+request_seconds = Histogram("aimend_request_seconds", "HTTP request duration by path", "path")
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(self.name, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    return _Stage(name) if METRICS_ENABLED else _NO_STAGE
+
+
+def server_timing(timings: list) -> str:
+    # repeated stages (e.g. retries) are summed into one entry
+    totals: dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+def dump_profile(profile: cProfile.Profile, path: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{int(time.time() * 1000)}{path.replace('/', '_')}.prof"
+    profile.dump_stats(os.path.join(PROFILE_DIR, name))
+
+
+profile_hook: Callable[[cProfile.Profile, str], None] = dump_profile
+_profiling = False  # one cProfile at a time: a second enable() would replace the first
+
+
+class ServerTimingMiddleware:
+    # pure ASGI so streamed responses keep streaming; the header carries the
+    # stages finished before the response starts
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        timings: list = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and timings:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        # cProfile hooks the thread, not the request: a sampled profile covers
+        # the whole event loop for the request's lifetime, including every
+        # other request interleaved with it. Samples that arrive while one is
+        # running are skipped.
+        global _profiling
+        profile = None
+        if PROFILE_SAMPLE_RATE > 0 and not _profiling and random.random() < PROFILE_SAMPLE_RATE:
+            _profiling = True
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if profile is not None:
+                profile.disable()
+                _profiling = False
+                try:
+                    profile_hook(profile, scope["path"])
+                except Exception as e:
+                    print("Profile hook failed", e)
+            # label by matched route only, so stray URLs can't grow the series
+            path = scope["path"] if scope.get("endpoint") is not None else "unmatched"
+            request_seconds.observe(path, time.perf_counter() - start)
+            _request_timings.reset(token)
+
+
+def render(extra: list | None = None) -> str:
+    lines = stage_seconds.render() + request_seconds.render() + (extra or [])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,326 @@
+# parsers.py
+# HTML extraction for the crawler. Functions are module-level so they can be
+# shipped to a ProcessPoolExecutor. BeautifulSoup/html.parser is the reference;
+# when lxml is installed it is used by default (PARSER_BACKEND=auto). It still
+# tokenizes with html.parser to keep bs4's tree rules, but builds and queries
+# the tree in C, about 2.5x faster on the fixtures. tests/test_parsers.py holds
+# both to the same output; PARSER_BACKEND=bs4 forces the reference.
+import os
+import re
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import List
+from urllib.parse import urljoin
+
+try:
+    import lxml
+    from lxml import etree
+except ImportError:  # optional accelerator
+    lxml = None
+
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "auto")  # auto | bs4 | lxml
+
+DTYPE_KEYWORDS = ("Opinion", "Report", "Amendment")
+
+
+def backend() -> str:
+    if PARSER_BACKEND == "bs4" or lxml is None:
+        return "bs4"
+    return "lxml"
+
+
+def resolve_url(href: str, base_url: str) -> str:
+    if href.startswith("/"):
+        return "https://www.europarl.europa.eu" + href
+    if href.startswith("http"):
+        return href
+    return base_url.rstrip("/") + "/" + href
+
+
+def accept_href(href: str) -> bool:
+    # accept links to document pages containing '/documents/' or '/_'
+    return "/documents/" in href or "/doceo/" in href or href.endswith(".pdf")
+
+
+def dedupe(results: List[dict]) -> List[dict]:
+    # dedupe preserving order
+    seen = set()
+    dedup = []
+    for r in results:
+        if r["url"] in seen: continue
+        seen.add(r["url"])
+        dedup.append(r)
+    return dedup
+
+
+NEXT_TEXTS = frozenset(("next", "next page", "›", "»", ">", ">>"))
+NEXT_WORD = re.compile(r"(?<![a-z])next(?![a-z])")  # "pager-next", "ep_next", not "context"
+
+
+def is_next_link(rel: str, cls: str, label: str, text: str) -> bool:
+    # pagination "next" link: rel="next", a next class or aria-label, or the usual link texts
+    return ("next" in rel.lower().split() or bool(NEXT_WORD.search(cls.lower()))
+            or bool(NEXT_WORD.search(label.lower())) or text.strip().lower() in NEXT_TEXTS)
+
+
+# --- BeautifulSoup reference backend
+def bs4_parse_listing(html: str, base_url: str) -> List[dict]:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    results = []
+    # Generic heuristics for links
+    for a in soup.select("a"):
+        href = a.get("href")
+        if not href:
+            continue
+        text = a.get_text(strip=True)
+        if not text:
+            continue
+        if accept_href(href):
+            results.append({"title": text, "url": resolve_url(href, base_url)})
+    return dedupe(results)
+
+
+def bs4_next_page(html: str, page_url: str) -> str | None:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.select("a[href]"):
+        rel, cls = a.get("rel") or "", a.get("class") or ""
+        rel = " ".join(rel) if isinstance(rel, list) else rel
+        cls = " ".join(cls) if isinstance(cls, list) else cls
+        if is_next_link(rel, cls, a.get("aria-label") or "", a.get_text(strip=True)):
+            return urljoin(page_url, a["href"])
+    return None
+
+
+def bs4_extract_detail(html: str) -> dict:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    title_tag = soup.select_one("h1, h2, .ep_title, .documentTitle")
+    title = title_tag.get_text(strip=True) if title_tag else ""
+    date_tag = soup.select_one(".date, .ep_date, time")
+    date = date_tag.get_text(strip=True) if date_tag else ""
+    p = soup.select_one("p, .summary, .ep_summary")
+    excerpt = p.get_text(strip=True) if p else ""
+    dtype = ""
+    dtype_tag = soup.find(string=lambda s: s and any(k in s for k in DTYPE_KEYWORDS))
+    if dtype_tag:
+        dtype = dtype_tag.strip()
+    return {"title": title, "date": date, "excerpt": excerpt, "doc_type": dtype}
+
+
+# --- lxml backend
+def _has_class(name: str) -> str:
+    return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+# parenthesised unions evaluate in document order, matching select_one
+TITLE_XPATH = f"(//h1 | //h2 | {_has_class('ep_title')} | {_has_class('documentTitle')})[1]"
+DATE_XPATH = f"({_has_class('date')} | {_has_class('ep_date')} | //time)[1]"
+EXCERPT_XPATH = f"(//p | {_has_class('summary')} | {_has_class('ep_summary')})[1]"
+STRINGS_XPATH = "//text() | //comment()"
+
+
+# strings under these tags are Script/Stylesheet/... in bs4, not NavigableString;
+# get_text() only returns strings of the tag's own kind
+STRING_CONTAINERS = frozenset(("script", "style", "template", "rt", "rp"))
+# bs4's HTMLTreeBuilder.empty_element_tags: closed as soon as they open
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+))
+# html5 named references without the ';', as bs4 looks them up
+ENTITIES = {name[:-1]: char for name, char in html5.items() if name.endswith(";")}
+
+
+def _container(node) -> str | None:
+    # name of the innermost string container around a text node, None for plain text
+    el = node.getparent()
+    if node.is_tail:
+        el = el.getparent()
+    while el is not None:
+        if el.tag in STRING_CONTAINERS:
+            return el.tag
+        el = el.getparent()
+    return None
+
+
+def _text(el) -> str:
+    # same as bs4 get_text(strip=True): stripped strings of the element's kind, comments excluded
+    kind = el.tag if el.tag in STRING_CONTAINERS else None
+    return "".join(s.strip() for s in el.xpath(".//text()") if _container(s) == kind)
+
+
+class _TreeParser(HTMLParser):
+    # Builds an lxml tree from html.parser events with BeautifulSoup's rules
+    # instead of libxml2's HTML recovery: nothing is closed implicitly (an
+    # unclosed <p> swallows what follows), an end tag pops back to the nearest
+    # open tag of that name and is ignored when none is open, and void tags
+    # close immediately. libxml2 would close <p> before a block or another <p>
+    # and treat <textarea> content as text, changing the extracted strings.
+    # References are decoded the way BeautifulSoupHTMLParser does, and an
+    # ignored end tag still ends the current string (an empty processing
+    # instruction keeps the two text nodes apart), so find(string=) sees the
+    # same strings.
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.builder = etree.TreeBuilder()
+        self.builder.start("document", {})
+        self.open: List[str] = []
+        self.closed_voids: List[str] = []  # a later </br> is swallowed, as in bs4
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, {k: v or "" for k, v in attrs})
+        if tag in VOID_TAGS:
+            self.builder.end(tag)
+            self.closed_voids.append(tag)
+        else:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.builder.start(tag, {k: v or "" for k, v in attrs})
+        self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_voids:
+            self.closed_voids.remove(tag)
+            return
+        if tag not in self.open:
+            self.builder.pi("split", "")
+            return
+        while self.open:
+            name = self.open.pop()
+            self.builder.end(name)
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+    def handle_charref(self, name):
+        self.builder.data(unescape(f"&#{name};"))
+
+    def handle_entityref(self, name):
+        self.builder.data(ENTITIES.get(name, "&" + name))
+
+    def handle_comment(self, data):
+        self.builder.comment(data)
+
+    def finish(self):
+        self.close()
+        while self.open:
+            self.builder.end(self.open.pop())
+        self.builder.end("document")
+        return self.builder.close()
+
+
+def _document(html: str):
+    if not html.strip():
+        return None
+    parser = _TreeParser()
+    parser.feed(html)
+    return parser.finish()
+
+
+def lxml_parse_listing(html: str, base_url: str) -> List[dict]:
+    doc = _document(html)
+    if doc is None:
+        return []
+    results = []
+    for a in doc.iter("a"):
+        href = a.get("href")
+        if not href:
+            continue
+        text = _text(a)
+        if not text:
+            continue
+        if accept_href(href):
+            results.append({"title": text, "url": resolve_url(href, base_url)})
+    return dedupe(results)
+
+
+def lxml_next_page(html: str, page_url: str) -> str | None:
+    doc = _document(html)
+    if doc is None:
+        return None
+    for a in doc.iter("a"):
+        href = a.get("href")
+        if href and is_next_link(a.get("rel") or "", a.get("class") or "", a.get("aria-label") or "", _text(a)):
+            return urljoin(page_url, href)
+    return None
+
+
+def lxml_extract_detail(html: str) -> dict:
+    doc = _document(html)
+    if doc is None:
+        return {"title": "", "date": "", "excerpt": "", "doc_type": ""}
+
+    def first_text(xpath: str) -> str:
+        found = doc.xpath(xpath)
+        return _text(found[0]) if found else ""
+
+    dtype = ""
+    for node in doc.xpath(STRINGS_XPATH):
+        s = node.text if isinstance(node, etree._Comment) else str(node)
+        if s and any(k in s for k in DTYPE_KEYWORDS):
+            dtype = s.strip()
+            break
+    return {"title": first_text(TITLE_XPATH), "date": first_text(DATE_XPATH),
+            "excerpt": first_text(EXCERPT_XPATH), "doc_type": dtype}
+
+
+# --- early stop for truncated fetches
+# Cheap byte-level signals that every field extract_detail looks for has been
+# closed in the prefix read so far; the crawler stops downloading once they
+# all hold. Heuristic by design: at worst it reads up to the byte cap.
+# an element with a whole class token (case-sensitive like the selectors:
+# "doc-date" or "Date" is not .date) whose text is closed by its own end tag
+_CLASS = rb"<([a-z][a-z0-9]*)\s[^>]*class=[\"'](?:[^\"']*\s)?(?-i:%s)(?:\s[^\"']*)?[\"'][^>]*>[^<]*</\1\s*>"
+COMPLETE_SIGNALS = (
+    re.compile(rb"</h[12]>|" + _CLASS % rb"(?:ep_title|documentTitle)", re.I),
+    re.compile(rb"</time>|" + _CLASS % rb"(?:ep_)?date", re.I),
+    re.compile(rb"</p>|" + _CLASS % rb"(?:ep_)?summary", re.I),
+    re.compile(rb">[^<]*(?:" + b"|".join(k.encode() for k in DTYPE_KEYWORDS) + rb")[^<]*<"),
+)
+
+
+def detail_complete(prefix: bytes) -> bool:
+    return all(p.search(prefix) for p in COMPLETE_SIGNALS)
+
+
+# --- dispatch
+def parse_listing(html: str, base_url: str) -> List[dict]:
+    if backend() == "lxml":
+        try:
+            return lxml_parse_listing(html, base_url)
+        except (ValueError, etree.ParserError):
+            pass
+    return bs4_parse_listing(html, base_url)
+
+
+def extract_detail(html: str) -> dict:
+    if backend() == "lxml":
+        try:
+            return lxml_extract_detail(html)
+        except (ValueError, etree.ParserError):
+            pass
+    return bs4_extract_detail(html)
+
+
+def next_page(html: str, page_url: str) -> str | None:
+    # absolute URL of the listing's next page, None on the last page
+    if backend() == "lxml":
+        try:
+            return lxml_next_page(html, page_url)
+        except (ValueError, etree.ParserError):
+            pass
+    return bs4_next_page(html, page_url)
+
+
+def parse_listing_page(html: str, base_url: str, page_url: str) -> tuple[List[dict], str | None]:
+    # documents plus next-page URL in one call, so a listing page costs one pool round-trip
+    return parse_listing(html, base_url), next_page(html, page_url)
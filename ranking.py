@@ -0,0 +1,86 @@
+# ranking.py
+# Indexed top-k version of rank_results over a corpus snapshot.
+#
+# rank_results scores substring matches (title +100, excerpt +50 for the whole
+# query, +10 per query term found in either field), so a plain word index
+# would change results. Instead every document's lowercased title and excerpt
+# are split into character trigrams once; a term's candidates are the
+# intersection of its trigram postings, verified with the same `in` test.
+# Only candidates are scored, and top-k is picked with a heap instead of a
+# full sort. Ties keep snapshot order, as the stable sort in rank_results does.
+import heapq
+from array import array
+from typing import List
+
+from corpus import Doc, Snapshot
+
+GRAM = 3
+
+
+def grams(text: str) -> set:
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class RankingEngine:
+    __slots__ = ("generation", "docs", "titles", "excerpts", "postings")
+
+    def __init__(self, snapshot: Snapshot):
+        self.generation = snapshot.generation
+        self.docs = snapshot.docs
+        self.titles = [d.title_l for d in self.docs]
+        self.excerpts = [d.excerpt_l for d in self.docs]
+        postings: dict[str, list] = {}
+        for i, (title, excerpt) in enumerate(zip(self.titles, self.excerpts)):
+            for g in grams(title) | grams(excerpt):
+                postings.setdefault(g, []).append(i)
+        self.postings = {g: array("I", ids) for g, ids in postings.items()}
+
+    def docs_containing(self, term: str) -> List[int]:
+        titles, excerpts = self.titles, self.excerpts
+        if len(term) < GRAM:
+            candidates = range(len(self.docs))
+        else:
+            lists = sorted((self.postings.get(g, ()) for g in grams(term)), key=len)
+            if not lists[0]:
+                return []
+            candidates = set(lists[0])
+            for ids in lists[1:]:
+                candidates.intersection_update(ids)
+                if not candidates:
+                    return []
+        return [i for i in candidates if term in titles[i] or term in excerpts[i]]
+
+    def search(self, q: str, top_k: int | None = None) -> List[Doc]:
+        ql = q.lower()
+        terms = ql.split()
+        if not terms:
+            return self.scan(ql, top_k)
+        overlap: dict[int, int] = {}
+        for term in dict.fromkeys(terms):
+            weight = terms.count(term)
+            for i in self.docs_containing(term):
+                overlap[i] = overlap.get(i, 0) + weight
+        # every document matching the whole query also matches its terms,
+        # so the candidates above are the only ones that can score > 0
+        titles, excerpts = self.titles, self.excerpts
+        scored = [
+            (-(10 * n + (100 if ql in titles[i] else 0) + (50 if ql in excerpts[i] else 0)), i)
+            for i, n in overlap.items()
+        ]
+        return self.select(scored, top_k)
+
+    def scan(self, ql: str, top_k: int | None) -> List[Doc]:
+        # whitespace-only queries have no terms; only the phrase bonus applies
+        scored = []
+        for i, (title, excerpt) in enumerate(zip(self.titles, self.excerpts)):
+            score = (100 if ql in title else 0) + (50 if ql in excerpt else 0)
+            if score:
+                scored.append((-score, i))
+        return self.select(scored, top_k)
+
+    def select(self, scored: list, top_k: int | None) -> List[Doc]:
+        if top_k is None or top_k >= len(scored):
+            scored.sort()
+        else:
+            scored = heapq.nsmallest(top_k, scored)
+        return [self.docs[i] for _, i in scored]
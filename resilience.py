@@ -0,0 +1,174 @@
+# resilience.py
+# Tail-latency controls for upstream calls:
+#
+#   * an end-to-end deadline shared by all attempts of one call, and a shorter
+#     per-attempt timeout (by default an even share of the deadline), so a
+#     hung attempt is abandoned and retried instead of using up the budget,
+#   * jittered retries for failures the caller marks retryable; every attempt
+#     calls attempt() again, so a signed request gets a fresh timestamp/nonce,
+#   * optional hedging: when an attempt is slower than a percentile of recent
+#     successful latencies, a second one is started and the first to succeed wins,
+#   * a circuit breaker that fails fast after repeated failed calls and lets a
+#     single probe through once reset_timeout has passed.
+#
+# Failures that exhaust the budget, and calls refused by an open breaker,
+# raise Unavailable so the caller can degrade instead of erroring.
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class Unavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed | open | half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0 or self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"  # this caller is the probe
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failure_threshold > 0 and (self.state == "half_open" or self.failures >= self.failure_threshold):
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        # the probe was cancelled before it settled: let the next caller probe
+        if self.state == "half_open":
+            self.state = "open"
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected, "trips": self.trips}
+
+
+class LatencyTracker:
+    # sliding window of successful attempt latencies
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: deque = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def _timed(attempt: Callable[[float], Awaitable[T]], timeout: float, latency: LatencyTracker | None) -> T:
+    start = time.monotonic()
+    result = await asyncio.wait_for(attempt(timeout), timeout)
+    if latency is not None:
+        latency.observe(time.monotonic() - start)
+    return result
+
+
+def _start(attempt: Callable[[float], Awaitable[T]], end: float, attempt_timeout: float,
+           latency: LatencyTracker | None) -> asyncio.Future:
+    # one attempt, bounded by its own timeout and by what is left of the deadline
+    timeout = max(0.0, min(attempt_timeout, end - time.monotonic()))
+    return asyncio.ensure_future(_timed(attempt, timeout, latency))
+
+
+async def _hedged(attempt: Callable[[float], Awaitable[T]], end: float, attempt_timeout: float,
+                  latency: LatencyTracker | None, hedge_after: float | None, stats: dict | None) -> T:
+    first = _start(attempt, end, attempt_timeout, latency)
+    if hedge_after is None or hedge_after >= min(attempt_timeout, end - time.monotonic()):
+        return await first
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            pending.add(_start(attempt, end, attempt_timeout, latency))
+            if stats is not None:
+                stats["hedges"] = stats.get("hedges", 0) + 1
+        error: BaseException | None = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, end - time.monotonic()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call(attempt: Callable[[float], Awaitable[T]], *, deadline: float, retries: int = 2,
+               backoff: float = 0.2, retryable: Callable[[BaseException], bool] = lambda e: True,
+               breaker: CircuitBreaker | None = None, latency: LatencyTracker | None = None,
+               hedge_percentile: float = 0, attempt_timeout: float = 0, stats: dict | None = None) -> T:
+    # attempt(timeout) performs one request within `timeout` seconds, which is
+    # also enforced around it; attempt_timeout 0 means deadline / (retries + 1).
+    # stats, when given, accumulates "attempts" and "hedges"
+    if breaker is not None and not breaker.allow():
+        raise Unavailable("circuit open")
+    end = time.monotonic() + deadline
+    attempt_timeout = attempt_timeout or deadline / (retries + 1)
+    last: BaseException | None = None
+    try:
+        for n in range(retries + 1):
+            if time.monotonic() >= end:
+                break
+            if stats is not None:
+                stats["attempts"] = stats.get("attempts", 0) + 1
+            hedge_after = latency.percentile(hedge_percentile) if latency is not None and hedge_percentile > 0 else None
+            try:
+                result = await _hedged(attempt, end, attempt_timeout, latency, hedge_after, stats)
+            except asyncio.TimeoutError as e:
+                last = e
+            except Exception as e:
+                if not retryable(e):
+                    # the upstream answered, it just refused this request
+                    if breaker is not None:
+                        breaker.record_success()
+                    raise
+                last = e
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+            if n < retries:
+                # full jitter, never sleeping past the deadline
+                await asyncio.sleep(min(random.uniform(0, backoff * 2 ** n), max(0.0, end - time.monotonic())))
+    except asyncio.CancelledError:
+        if breaker is not None:
+            breaker.release_probe()
+        raise
+    if breaker is not None:
+        breaker.record_failure()
+    if last is None or isinstance(last, asyncio.TimeoutError):
+        raise Unavailable(f"deadline of {deadline}s exceeded")
+    raise Unavailable(str(last).splitlines()[0] if str(last) else type(last).__name__)
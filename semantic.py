@@ -0,0 +1,276 @@
+# semantic.py
+# CPU-only semantic retrieval for chat candidate selection.
+#
+# Documents (title weighted twice + excerpt) become TF-IDF vectors that are
+# reduced with a randomized truncated SVD (latent semantic analysis), so terms
+# that co-occur across the corpus ("farm subsidies", "CAP direct payments")
+# land near each other even without shared words. Vectors are searched with
+# an IVF index (k-means coarse lists, nprobe lists scanned per query) once the
+# corpus is large enough, brute force below that. The whole index is one .npz
+# file next to DB_PATH.
+#
+#   python semantic.py --bench 10000 100000 1000000
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "the of and to in on for a an by with at from or as is are be this that it its into "
+    "de la le les et des du en".split()
+)
+FORMAT_VERSION = 2
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def doc_tokens(title: str, excerpt: str | None) -> List[str]:
+    title_tokens = tokenize(title or "")
+    return title_tokens + title_tokens + tokenize(excerpt or "")
+
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class Csr:
+    # minimal CSR matrix: the two products randomized SVD needs, nothing more
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, shape: Tuple[int, int]):
+        self.indptr, self.indices, self.data, self.shape = indptr, indices, data, shape
+        self.row_of = np.repeat(np.arange(shape[0], dtype=np.int64), np.diff(indptr))
+
+    def dot(self, m: np.ndarray, chunk: int = 1 << 20) -> np.ndarray:
+        # self @ m
+        out = np.zeros((self.shape[0], m.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.data), chunk):
+            sl = slice(start, start + chunk)
+            np.add.at(out, self.row_of[sl], self.data[sl, None] * m[self.indices[sl]])
+        return out
+
+    def tdot(self, m: np.ndarray, chunk: int = 1 << 20) -> np.ndarray:
+        # self.T @ m
+        out = np.zeros((self.shape[1], m.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.data), chunk):
+            sl = slice(start, start + chunk)
+            np.add.at(out, self.indices[sl], self.data[sl, None] * m[self.row_of[sl]])
+        return out
+
+
+def tfidf_matrix(token_lists: Sequence[List[str]], vocab: dict, idf: np.ndarray) -> Csr:
+    indptr, indices, data = [0], [], []
+    for tokens in token_lists:
+        counts = Counter(t for t in tokens if t in vocab)
+        if counts:
+            cols = np.fromiter((vocab[t] for t in counts), dtype=np.int64, count=len(counts))
+            vals = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * idf[cols]
+            vals /= np.linalg.norm(vals)
+            indices.append(cols)
+            data.append(vals.astype(np.float32))
+        indptr.append(indptr[-1] + len(counts))
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    data = np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+    return Csr(np.asarray(indptr, dtype=np.int64), indices, data, (len(token_lists), len(vocab)))
+
+
+def randomized_svd(a: Csr, k: int, oversample: int = 10, power_iters: int = 2, seed: int = 0) -> np.ndarray:
+    # returns the top-k right singular vectors (terms x k)
+    rng = np.random.default_rng(seed)
+    width = min(k + oversample, min(a.shape))
+    y = a.dot(rng.standard_normal((a.shape[1], width)).astype(np.float32))
+    for _ in range(power_iters):
+        q, _ = np.linalg.qr(y)
+        z, _ = np.linalg.qr(a.tdot(q))
+        y = a.dot(z)
+    q, _ = np.linalg.qr(y)
+    b = a.tdot(q).T  # width x terms
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return np.ascontiguousarray(vt[:k].T.astype(np.float32))
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def nearest(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    return np.concatenate([np.argmax(x[i:i + chunk] @ centroids.T, axis=1) for i in range(0, len(x), chunk)]
+                          or [np.zeros(0, dtype=np.int64)])
+
+
+class SemanticIndex:
+    def __init__(self, urls: List[str], terms: List[str], idf: np.ndarray, components: np.ndarray,
+                 vectors: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray):
+        self.urls = urls
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.idf = idf
+        self.components = components
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    @classmethod
+    def build(cls, docs: Sequence, dim: int = 128, max_terms: int = 50000, min_df: int = 2,
+              ivf_threshold: int = 20000, kmeans_sample: int = 50000) -> "SemanticIndex":
+        # docs: anything with .url, .title and .excerpt (corpus.Doc)
+        token_lists = [doc_tokens(d.title, d.excerpt) for d in docs]
+        n = len(token_lists)
+        df = Counter(t for tokens in token_lists for t in set(tokens))
+        if n < 50:
+            min_df = 1
+        terms = [t for t, c in df.most_common(max_terms) if c >= min_df]
+        vocab = {t: i for i, t in enumerate(terms)}
+        idf = np.asarray([math.log((1 + n) / (1 + df[t])) + 1.0 for t in terms], dtype=np.float32)
+        a = tfidf_matrix(token_lists, vocab, idf)
+        if not terms or not n:
+            components = np.zeros((len(terms), 0), dtype=np.float32)
+        else:
+            # keep the rank well below the vocabulary size: a near full-rank
+            # projection reproduces plain TF-IDF and loses the term grouping
+            components = randomized_svd(a, min(dim, max(2, len(terms) // 4), n))
+        vectors = normalize_rows(a.dot(components)).astype(np.float32)
+
+        centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        list_offsets = np.zeros(1, dtype=np.int64)
+        list_ids = np.zeros(0, dtype=np.int64)
+        if n >= ivf_threshold:
+            nlist = int(math.sqrt(n))
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, size=min(n, kmeans_sample), replace=False)]
+            centroids = kmeans(sample, nlist)
+            assign = nearest(vectors, centroids)
+            list_ids = np.argsort(assign, kind="stable")
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return cls([d.url for d in docs], terms, idf, components, vectors, centroids, list_offsets, list_ids)
+
+    def embed(self, q: str) -> np.ndarray | None:
+        counts = Counter(t for t in tokenize(q) if t in self.vocab)
+        if not counts or not self.components.shape[1]:
+            return None
+        cols = np.fromiter((self.vocab[t] for t in counts), dtype=np.int64, count=len(counts))
+        vals = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[cols]
+        v = vals @ self.components[cols]
+        norm = np.linalg.norm(v)
+        return v / norm if norm else None
+
+    def search(self, q: str, top_k: int, nprobe: int = 8) -> List[Tuple[str, float]]:
+        qv = self.embed(q)
+        if qv is None or top_k <= 0:
+            return []
+        if len(self.centroids):
+            lists = np.argsort(-(self.centroids @ qv))[:nprobe]
+            ids = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+        else:
+            ids = np.arange(len(self.urls))
+        if not len(ids):
+            return []
+        scores = self.vectors[ids] @ qv
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.urls[ids[i]], float(scores[i])) for i in top if scores[i] > 1e-6]
+
+    def save(self, path: str):
+        # write to a temp file and rename, so a reader never sees a partial index
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, version=np.asarray(FORMAT_VERSION), urls=np.asarray(self.urls, dtype=str),
+                 terms=np.asarray(self.terms, dtype=str), idf=self.idf, components=self.components,
+                 vectors=self.vectors, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_ids=self.list_ids)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SemanticIndex":
+        with np.load(path, allow_pickle=False) as f:
+            if int(f["version"]) != FORMAT_VERSION:
+                raise ValueError(f"unsupported semantic index version {int(f['version'])}")
+            return cls(f["urls"].tolist(), f["terms"].tolist(), f["idf"], f["components"], f["vectors"],
+                       f["centroids"], f["list_offsets"], f["list_ids"])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    # hybrid merge of keyword and semantic result lists by URL
+    scores: dict[str, float] = {}
+    for ranked in rankings:
+        for rank, url in enumerate(ranked):
+            scores[url] = scores.get(url, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda u: -scores[u])
+
+
+# --- benchmark
+def synthetic_docs(n: int, seed: int = 0):
+    from corpus import Doc
+
+    rng = np.random.default_rng(seed)
+    topics = [
+        "cap direct payments farmers income support",
+        "farm subsidies agricultural aid rural",
+        "fisheries quotas fleet marine",
+        "pesticides plant protection health",
+        "organic farming labelling certification",
+        "dairy milk market prices",
+        "climate emissions agriculture adaptation",
+        "water irrigation drought soil",
+        "trade agreements imports tariffs",
+        "livestock animal welfare transport",
+    ]
+    vocab = sorted({w for t in topics for w in t.split()})
+    words = [t.split() for t in topics]
+    docs = []
+    for i in range(n):
+        a, b = rng.choice(len(topics), size=2, replace=False)
+        title = " ".join(rng.choice(words[a], size=4))
+        excerpt = " ".join(list(rng.choice(words[a], size=12)) + list(rng.choice(words[b], size=4))
+                           + list(rng.choice(vocab, size=4)))
+        docs.append(Doc(f"Report {i} {title}", f"https://example.test/documents/{i}", "Report", None, excerpt))
+    return docs
+
+
+def bench(sizes: Sequence[int], queries: int = 200, top_k: int = 5):
+    qs = ["farm subsidies", "CAP direct payments", "animal welfare", "drought", "milk prices",
+          "imports tariffs", "organic labelling", "marine quotas"]
+    for n in sizes:
+        docs = synthetic_docs(n)
+        t0 = time.perf_counter()
+        index = SemanticIndex.build(docs)
+        build = time.perf_counter() - t0
+        lat = []
+        for i in range(queries):
+            t0 = time.perf_counter()
+            index.search(qs[i % len(qs)], top_k)
+            lat.append(time.perf_counter() - t0)
+        lat.sort()
+        print(f"n={n:8d} build={build:7.1f}s ivf={'yes' if len(index.centroids) else 'no ':3s} "
+              f"p50={lat[len(lat) // 2] * 1000:6.2f}ms p95={lat[int(len(lat) * 0.95)] * 1000:6.2f}ms "
+              f"vectors={index.vectors.nbytes / 1e6:.1f}MB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Semantic index query latency benchmark")
+    parser.add_argument("--bench", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    bench(args.bench, args.queries)
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the modules live at the repository root, not in a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def fresh_main(tmp_path, monkeypatch):
+    # main configured for an empty database under tmp_path; call it with the
+    # committees to shard by. Module state is reset again afterwards.
+    import main
+
+    def reset():
+        main.close_writer()
+        main._read_uris.clear()
+        main._artifact_meta.clear()
+        main._read_epoch += 1
+        main.answer_cache.clear()
+
+    def configure(committees=("agri",), **settings):
+        reset()
+        monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "agri_docs.db"))
+        monkeypatch.setattr(main, "SEMANTIC_INDEX_PATH", str(tmp_path / "agri_docs.db.semantic.npz"))
+        monkeypatch.setattr(main, "INDEX_ARTIFACT", "")
+        monkeypatch.setattr(main, "COMMITTEES", list(committees))
+        monkeypatch.setattr(main, "PRIMARY_COMMITTEE", committees[0])
+        monkeypatch.setattr(main, "_snapshot", None)
+        monkeypatch.setattr(main, "_generation", 0)
+        monkeypatch.setattr(main, "_engine", None)
+        monkeypatch.setattr(main, "_semantic", None)
+        # crawls parse on a thread and run unthrottled unless a test says otherwise
+        monkeypatch.setattr(main, "PARSE_WORKERS", 0)
+        monkeypatch.setattr(main, "_parse_pool", None)
+        monkeypatch.setattr(main, "CRAWL_RATE_PER_HOST", 0)
+        monkeypatch.setattr(main, "CRAWL_DELAY", 0)
+        for name, value in settings.items():
+            monkeypatch.setattr(main, name, value)
+        main.ensure_db()
+        return main
+
+    yield configure
+    reset()
@@ -0,0 +1,105 @@
+# In-process stand-in for the europarl listing and document pages, served
+# through httpx.MockTransport so crawls run without the network. Records every
+# request and can inject failures per URL.
+import asyncio
+import time
+
+import httpx
+
+HOST = "https://www.europarl.europa.eu"
+
+
+class StubSite:
+    def __init__(self, documents: int = 20, page_size: int = 50, committees=("agri",), latency: float = 0.0,
+                 pdf_every: int = 0, padding: int = 0):
+        self.documents = documents
+        self.page_size = page_size
+        self.committees = committees
+        self.latency = latency
+        self.pdf_every = pdf_every  # every n-th document is a PDF, 0 = none
+        self.padding = padding  # filler bytes after the fields a detail page carries
+        self.faults: dict[str, list] = {}  # url -> statuses (or "timeout") served before the page
+        self.conditional = True  # answer a matching If-None-Match with 304
+        self.versions: dict[str, int] = {}  # url -> content version, bump to change a page
+        self.requests: list = []  # (monotonic start, method, url, headers)
+        self.bytes_sent: dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def listing_url(self, committee: str = "agri") -> str:
+        return f"{HOST}/committees/en/{committee}/documents/latest-documents"
+
+    def document_url(self, i: int, committee: str = "agri") -> str:
+        suffix = ".pdf" if self.pdf_every and i % self.pdf_every == self.pdf_every - 1 else ""
+        return f"{HOST}/committees/en/{committee}/documents/d{i}{suffix}"
+
+    def document_urls(self, committee: str = "agri") -> list:
+        return [self.document_url(i, committee) for i in range(self.documents)]
+
+    def requested(self, method: str | None = None) -> list:
+        return [url for _, m, url, _ in self.requests if method is None or m == method]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests.append((time.monotonic(), request.method, url, dict(request.headers)))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            faults = self.faults.get(url)
+            if faults:
+                fault = faults.pop(0)
+                if fault == "timeout":
+                    raise httpx.ReadTimeout("stub timeout", request=request)
+                return httpx.Response(fault, request=request)
+            return self.page(request)
+        finally:
+            self.in_flight -= 1
+
+    def page(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url).split("?")[0]
+        for committee in self.committees:
+            if url == self.listing_url(committee):
+                return self.listing(committee, int(request.url.params.get("page", "1")))
+            prefix = f"{HOST}/committees/en/{committee}/documents/d"
+            if url.startswith(prefix):
+                return self.document(request, committee, url[len(prefix):].removesuffix(".pdf"))
+        return httpx.Response(404)
+
+    def listing(self, committee: str, page: int) -> httpx.Response:
+        # newest (highest number) first, like the real listing
+        first = (page - 1) * self.page_size
+        ids = range(self.documents - 1 - first, max(-1, self.documents - 1 - first - self.page_size), -1)
+        links = "".join(f'<li><a href="{self.document_url(i, committee)[len(HOST):]}">Document {i}</a></li>'
+                        for i in ids)
+        if first + self.page_size < self.documents:
+            links += f'<a rel="next" href="?page={page + 1}">Next</a>'
+        return httpx.Response(200, text=f"<html><body><ul>{links}</ul></body></html>",
+                              headers={"content-type": "text/html; charset=utf-8"})
+
+    def document(self, request: httpx.Request, committee: str, i: str) -> httpx.Response:
+        url = str(request.url)
+        version = self.versions.get(url, 1)
+        etag = f'"{committee}-{i}-{version}"'
+        if self.conditional and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"etag": etag})
+        if url.endswith(".pdf"):
+            return httpx.Response(200, headers={"content-type": "application/pdf", "etag": etag},
+                                  content=b"" if request.method == "HEAD" else b"%PDF-1.4")
+        body = (f"<html><body><h1>Report {i} on farm income v{version}</h1><span class=\"date\">0{version}.01.2024"
+                f"</span><p>Farm subsidies in {committee} document {i}.</p><div>{'x' * self.padding}</div>"
+                "</body></html>").encode()
+
+        async def stream():
+            # counts what the crawler actually pulls, so truncation is visible
+            for start in range(0, len(body), 4096):
+                chunk = body[start:start + 4096]
+                self.bytes_sent[url] = self.bytes_sent.get(url, 0) + len(chunk)
+                yield chunk
+
+        return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8", "etag": etag},
+                              content=stream())
@@ -0,0 +1,60 @@
+# Single-flight behaviour of AnswerCache.get_or_compute.
+import asyncio
+
+from cache import AnswerCache
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def run():
+        cache, calls = AnswerCache(), []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.ensure_future(cache.get_or_compute("q", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_compute("q", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "answer"
+        assert leader.cancelled()
+        assert len(calls) == 1
+        assert cache.get("q") == "answer" and not cache._inflight
+
+    asyncio.run(run())
+
+
+def test_call_finishes_and_is_cached_when_every_caller_is_cancelled():
+    async def run():
+        cache = AnswerCache()
+
+        async def compute():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        caller = asyncio.ensure_future(cache.get_or_compute("q", compute))
+        await asyncio.sleep(0.005)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        assert cache.get("q") == "answer"
+
+    asyncio.run(run())
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    async def run():
+        cache = AnswerCache()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("worker down")
+
+        results = await asyncio.gather(*(cache.get_or_compute("q", compute) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.get("q") is None and not cache._inflight
+        assert cache.stats()["coalesced"] == 2
+
+    asyncio.run(run())
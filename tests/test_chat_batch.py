@@ -0,0 +1,54 @@
+# /api/chat/batch: one retrieval view per batch, failures isolated per question.
+import asyncio
+
+import httpx
+
+import corpus
+import handler
+
+FARM = {"title": "Farm income report", "url": "https://example.org/1", "excerpt": "farm income"}
+NEWER = {"title": "Farm subsidies opinion", "url": "https://example.org/2", "excerpt": "farm subsidies"}
+
+
+def test_batch_ranks_every_question_against_one_generation(fresh_main, monkeypatch):
+    main = fresh_main(SEARCH_BACKEND="memory", CHAT_RETRIEVAL="keyword")
+    main.upsert_documents([FARM])
+    search = main.search_documents
+    calls = []
+
+    def search_then_swap(q, limit, engine=None):
+        rows = search(q, limit, engine)
+        if not calls:
+            # a crawl publishes a new generation right after the first question
+            main._snapshot = corpus.build_snapshot([NEWER], main._generation + 1)
+        calls.append([r["url"] for r in rows])
+        return rows
+
+    monkeypatch.setattr(main, "search_documents", search_then_swap)
+    main.retrieve_candidates_batch(["farm", "farm", "farm"], 5)
+    assert calls == [[FARM["url"]]] * 3
+
+
+def test_batch_isolates_a_failing_retrieval(fresh_main, monkeypatch):
+    main = fresh_main(WORKER_URL="http://worker.test", WORKER_SHARED_SECRET="test-secret")
+    main.upsert_documents([FARM])
+    monkeypatch.setattr(handler, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"reply": "[]"}))))
+    search = main.search_documents
+
+    def failing_search(q, limit, engine=None):
+        if q == "boom":
+            raise RuntimeError("fts5: syntax error")
+        return search(q, limit, engine)
+
+    monkeypatch.setattr(main, "search_documents", failing_search)
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            return await client.post("/api/chat/batch", json={"questions": ["farm", "boom", "income"]})
+
+    resp = asyncio.run(post())
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert results[1]["error"] == "retrieval failed: fts5: syntax error"
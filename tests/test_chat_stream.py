@@ -0,0 +1,102 @@
+# /api/chat with "stream": true relays the worker's SSE body.
+import asyncio
+import hashlib
+import hmac
+import json
+
+import httpx
+import pytest
+
+import bench
+import handler
+import resilience
+
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def main(fresh_main):
+    main = fresh_main(WORKER_URL="http://worker.test", WORKER_SHARED_SECRET=SECRET, WORKER_RETRY_BACKOFF=0,
+                      WORKER_FALLBACK=True, worker_breaker=resilience.CircuitBreaker(5, 30))
+    main.upsert_documents([{"title": "Farm income report", "url": "https://example.org/1", "excerpt": "farm"}])
+    return main
+
+
+def use_worker(monkeypatch, transport: httpx.AsyncBaseTransport):
+    monkeypatch.setattr(handler, "_client", httpx.AsyncClient(transport=transport))
+
+
+def chat(main, **body) -> httpx.Response:
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://app") as client:
+            return await client.post("/api/chat", json={"q": "farm", "stream": True, **body})
+
+    return asyncio.run(post())
+
+
+def test_stream_relays_worker_chunks_in_order(main, monkeypatch):
+    envelopes = []
+    worker = httpx.ASGITransport(app=bench.stub_worker_app(0))
+
+    class Recording(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            raw = await request.aread()
+            envelopes.append((raw, request.headers["x-signature"]))
+            return await worker.handle_async_request(request)
+
+    use_worker(monkeypatch, Recording())
+    resp = chat(main)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = [line for line in resp.text.split("\n\n") if line]
+    assert events == ['data: {"choices":[{"delta":{"content":"["}}]}',
+                      'data: {"choices":[{"delta":{"content":"]"}}]}', "data: [DONE]"]
+    (raw, signature), = envelopes
+    assert json.loads(raw)["stream"] is True
+    assert signature == "sha256=" + hmac.new(SECRET.encode(), raw, hashlib.sha256).hexdigest()
+
+
+def test_stream_falls_back_to_candidates_when_the_worker_is_down(main, monkeypatch):
+    def down(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    use_worker(monkeypatch, httpx.MockTransport(down))
+    resp = chat(main)
+    assert resp.status_code == 200
+    event, data = resp.text.strip().split("\n")
+    assert event == "event: fallback"
+    payload = json.loads(data.removeprefix("data: "))
+    assert payload["fallback"] is True
+    assert [c["url"] for c in payload["candidates"]] == ["https://example.org/1"]
+
+
+def test_client_disconnect_closes_the_worker_response(main, monkeypatch):
+    upstream = []
+
+    async def endless():
+        yield b"data: first\n\n"
+        await asyncio.Event().wait()
+
+    def worker(request):
+        upstream.append(httpx.Response(200, headers={"content-type": "text/event-stream"}, content=endless()))
+        return upstream[-1]
+
+    use_worker(monkeypatch, httpx.MockTransport(worker))
+
+    async def run():
+        response = await main.stream_from_worker({"model": "m", "messages": []}, [])
+        first_chunk, stalled = asyncio.Event(), asyncio.Event()
+
+        async def receive():
+            await first_chunk.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message.get("body"):
+                first_chunk.set()
+                await stalled.wait()  # a slow client: the relay is parked at its yield
+
+        await response({"type": "http"}, receive, send)
+        assert upstream[0].is_closed
+
+    asyncio.run(run())
@@ -0,0 +1,169 @@
+# crawl_and_index against the in-process stand-in site (tests/stub_site.py).
+import asyncio
+import time
+
+import jobs
+import parsers
+from stub_site import StubSite
+
+
+def crawl(main, site: StubSite, new_only: bool = False) -> jobs.CrawlProgress:
+    progress = jobs.CrawlProgress(new_only)
+    asyncio.run(main.crawl_and_index(transport=site.transport(), new_only=new_only, progress=progress))
+    return progress
+
+
+def indexed(main) -> dict:
+    cur = main.get_reader("agri").execute("SELECT url, title, date, excerpt FROM documents")
+    return {r["url"]: dict(r) for r in cur.fetchall()}
+
+
+def test_crawls_thousands_of_pages_with_bounded_workers(fresh_main):
+    main = fresh_main(CRAWL_WORKERS=8, CRAWL_LIMIT=5000, LISTING_MAX_PAGES=20)
+    site = StubSite(documents=2000, page_size=200, latency=0.001)
+    progress = crawl(main, site)
+    assert (progress.listed, progress.fetched, progress.parsed, progress.upserted) == (2000, 2000, 2000, 2000)
+    assert progress.failed == 0 and progress.error is None
+    assert 1 < site.max_in_flight <= 8
+    rows = indexed(main)
+    assert set(rows) == set(site.document_urls())
+    assert rows[site.document_url(7)]["title"] == "Report 7 on farm income v1"
+    assert rows[site.document_url(7)]["date"] == "01.01.2024"
+
+
+def test_upserts_in_batches(fresh_main, monkeypatch):
+    main = fresh_main(UPSERT_BATCH_SIZE=10)
+    batches = []
+    upsert = main.upsert_documents
+
+    def recording_upsert(batch, committee=None):
+        if batch:
+            batches.append(len(batch))
+        upsert(batch, committee)
+
+    monkeypatch.setattr(main, "upsert_documents", recording_upsert)
+    progress = crawl(main, StubSite(documents=35))
+    assert sorted(batches, reverse=True) == [10, 10, 10, 5]
+    assert progress.upserted == 35
+
+
+def test_retries_5xx_and_timeouts_with_backoff(fresh_main):
+    main = fresh_main(CRAWL_RETRIES=3, CRAWL_BACKOFF=0.02)
+    site = StubSite(documents=5)
+    flaky, slow, dead = site.document_url(1), site.document_url(2), site.document_url(3)
+    site.faults = {flaky: [503, 502], slow: ["timeout"], dead: [500] * 4}
+    progress = crawl(main, site)
+
+    assert site.requested().count(flaky) == 3 and site.requested().count(slow) == 2
+    starts = [t for t, _, url, _ in site.requests if url == flaky]
+    # jittered exponential backoff: at least half of backoff * 2**attempt between tries
+    assert starts[1] - starts[0] >= 0.01 and starts[2] - starts[1] >= 0.02
+    assert site.requested().count(dead) == 4  # first try plus CRAWL_RETRIES
+    rows = indexed(main)
+    assert rows[flaky]["title"].startswith("Report 1") and rows[slow]["title"].startswith("Report 2")
+    # a page that never recovered keeps its listing title and counts as failed
+    assert rows[dead]["title"] == "Document 3" and progress.failed == 1
+
+
+def test_spaces_requests_to_one_host(fresh_main):
+    main = fresh_main(CRAWL_WORKERS=8, CRAWL_RATE_PER_HOST=100)
+    site = StubSite(documents=15)
+    crawl(main, site)
+    starts = sorted(t for t, *_ in site.requests)
+    # the k-th request may not start before k slots of 1 / CRAWL_RATE_PER_HOST
+    assert all(t - starts[0] >= k * 0.01 - 0.003 for k, t in enumerate(starts))
+
+
+# --- recrawls: conditional requests, unchanged content, new_only (user-004)
+def test_recrawl_sends_validators_and_skips_304s(fresh_main):
+    main = fresh_main()
+    site = StubSite(documents=10)
+    crawl(main, site)
+    site.versions[site.document_url(4)] = 2
+    progress = crawl(main, site)
+    second = site.requests[-10:]
+    assert all(headers.get("if-none-match") for _, method, url, headers in second if "/documents/d" in url)
+    assert (progress.fetched, progress.skipped, progress.upserted) == (10, 9, 1)
+    assert indexed(main)[site.document_url(4)]["title"] == "Report 4 on farm income v2"
+
+
+def test_unchanged_content_only_refreshes_validators(fresh_main):
+    main = fresh_main()
+    site = StubSite(documents=6)
+    crawl(main, site)
+    generation = main.current_generation()
+    site.conditional = False  # the server ignores If-None-Match and resends the page
+    progress = crawl(main, site)
+    assert (progress.parsed, progress.skipped, progress.upserted) == (0, 6, 0)
+    assert main.current_generation() == generation  # nothing upserted, no snapshot refresh
+
+
+def test_failed_refetch_keeps_the_indexed_row(fresh_main):
+    main = fresh_main(CRAWL_RETRIES=0)
+    site = StubSite(documents=3)
+    crawl(main, site)
+    url = site.document_url(1)
+    site.faults[url] = [500]
+    site.versions[url] = 2  # bypass the 304 so the fetch really fails
+    progress = crawl(main, site)
+    assert progress.failed == 1
+    assert indexed(main)[url]["title"] == "Report 1 on farm income v1"
+
+
+def test_new_only_stops_at_the_first_known_document(fresh_main):
+    main = fresh_main()
+    site = StubSite(documents=10, page_size=4)
+    crawl(main, site)
+    site.requests.clear()
+    site.documents = 13  # three new documents at the top of the listing
+    progress = crawl(main, site, new_only=True)
+    assert progress.listed == 3 and progress.upserted == 3
+    fetched = [url for url in site.requested() if "/documents/d" in url]
+    assert sorted(fetched) == sorted(site.document_url(i) for i in (10, 11, 12))
+    assert len(indexed(main)) == 13
+
+
+# --- binaries and truncated reads (user-006)
+def test_binary_documents_only_get_a_head_request(fresh_main):
+    main = fresh_main()
+    site = StubSite(documents=10, pdf_every=5)
+    progress = crawl(main, site)
+    pdfs = [url for url in site.document_urls() if url.endswith(".pdf")]
+    assert len(pdfs) == 2 and progress.upserted == 10
+    for url in pdfs:
+        assert [m for _, m, u, _ in site.requests if u == url] == ["HEAD"]
+        assert indexed(main)[url]["title"].startswith("Document ")
+    # unchanged validators on the next HEAD: skipped, nothing rewritten
+    site.conditional = False
+    assert crawl(main, site).skipped == 10
+
+
+def test_detail_reads_stop_once_the_fields_are_in(fresh_main):
+    main = fresh_main(DETAIL_MAX_BYTES=65536)
+    site = StubSite(documents=3, padding=200_000)
+    crawl(main, site)
+    rows = indexed(main)
+    for i, url in enumerate(site.document_urls()):
+        # the fields sit in the first chunk, so the read stops long before the cap
+        assert site.bytes_sent[url] <= 16384 + 4096
+        assert rows[url]["title"] == f"Report {i} on farm income v1"
+        assert rows[url]["date"] == "01.01.2024"
+        assert f"document {i}" in rows[url]["excerpt"]
+
+
+def test_detail_reads_in_full_without_a_cap(fresh_main):
+    main = fresh_main(DETAIL_MAX_BYTES=0)
+    site = StubSite(documents=2, padding=200_000)
+    crawl(main, site)
+    assert all(site.bytes_sent[url] > 200_000 for url in site.document_urls())
+    assert indexed(main)[site.document_url(1)]["title"] == "Report 1 on farm income v1"
+
+
+def test_detail_reads_stop_at_the_byte_cap(fresh_main, monkeypatch):
+    main = fresh_main(DETAIL_MAX_BYTES=65536)
+    monkeypatch.setattr(parsers, "detail_complete", lambda head: False)
+    site = StubSite(documents=2, padding=200_000)
+    crawl(main, site)
+    for url in site.document_urls():
+        assert 65536 <= site.bytes_sent[url] <= 65536 + 16384 + 4096
+    assert indexed(main)[site.document_url(0)]["title"] == "Report 0 on farm income v1"
@@ -0,0 +1,28 @@
+# Sampled request profiling in ServerTimingMiddleware.
+import asyncio
+
+import metrics
+
+
+def test_only_one_profile_runs_at_a_time(monkeypatch):
+    profiled = []
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(metrics, "profile_hook", lambda profile, path: profiled.append(path))
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(message):
+        pass
+
+    middleware = metrics.ServerTimingMiddleware(app)
+
+    async def run():
+        await asyncio.gather(*(middleware({"type": "http", "path": f"/r{i}"}, None, noop) for i in range(3)))
+        await middleware({"type": "http", "path": "/after"}, None, noop)
+
+    asyncio.run(run())
+    assert profiled == ["/r0", "/after"]
+    assert not metrics._profiling
@@ -0,0 +1,62 @@
+# Both parser backends against the saved fixtures. expected.json holds the
+# BeautifulSoup output; the lxml backend, the default when lxml is installed,
+# must reproduce it exactly.
+import json
+from pathlib import Path
+
+import pytest
+
+import parsers
+
+FIXTURES = Path(__file__).with_name("fixtures")
+EXPECTED = json.loads((FIXTURES / "expected.json").read_text(encoding="utf-8"))
+BASE_URL = "https://www.europarl.europa.eu/committees/en/agri/documents"
+DETAIL_FIXTURES = sorted(name for name in EXPECTED if name.startswith("detail"))
+
+BACKENDS = [
+    "bs4",
+    pytest.param("lxml", marks=pytest.mark.skipif(parsers.lxml is None, reason="lxml not installed")),
+]
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    monkeypatch.setattr(parsers, "PARSER_BACKEND", request.param)
+    assert parsers.backend() == request.param
+    return request.param
+
+
+def test_listing(backend):
+    documents, next_url = parsers.parse_listing_page(fixture("listing.html"), BASE_URL, BASE_URL + "?page=1")
+    assert documents == EXPECTED["listing.html"]["documents"]
+    assert next_url == EXPECTED["listing.html"]["next_page"]
+
+
+@pytest.mark.parametrize("name", DETAIL_FIXTURES)
+def test_detail(backend, name):
+    assert parsers.extract_detail(fixture(name)) == EXPECTED[name]
+
+
+@pytest.mark.skipif(parsers.lxml is None, reason="lxml not installed")
+def test_lxml_is_the_default_when_installed(monkeypatch):
+    monkeypatch.setattr(parsers, "PARSER_BACKEND", "auto")
+    assert parsers.backend() == "lxml"
+
+
+@pytest.mark.skipif(parsers.lxml is None, reason="lxml not installed")
+@pytest.mark.parametrize("name", DETAIL_FIXTURES)
+def test_lxml_does_not_fall_back(name):
+    # a fallback to bs4 would make test_detail pass without exercising lxml
+    assert parsers.lxml_extract_detail(fixture(name)) == EXPECTED[name]
+
+
+@pytest.mark.parametrize("name", DETAIL_FIXTURES)
+def test_truncated_detail_matches_full(name):
+    # the crawler stops reading at the first prefix detail_complete accepts
+    body = fixture(name).encode()
+    end = next((n for n in range(1, len(body) + 1) if parsers.detail_complete(body[:n])), len(body))
+    assert parsers.extract_detail(body[:end].decode(errors="replace")) == EXPECTED[name]
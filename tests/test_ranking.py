@@ -0,0 +1,44 @@
+# RankingEngine must return exactly what the reference scorer in main returns,
+# order of ties included, on a fixed corpus and query set.
+import random
+
+import pytest
+
+import corpus
+import ranking
+from main import rank_results
+
+WORDS = ("agriculture CAP direct payments farm farmers subsidies fisheries rural development livestock "
+         "organic pesticides water climate trade dairy a an of é Über İstanbul").split()
+
+
+def reference_rows() -> list:
+    rng = random.Random(3)
+    rows = [{"title": " ".join(rng.choices(WORDS, k=rng.randint(0, 6))), "url": f"https://example.org/d{i}",
+             "excerpt": rng.choice([None, "", " ".join(rng.choices(WORDS, k=20))])}
+            for i in range(2000)]
+    # hand-written edge cases: empty fields, whole-query hits, terms spanning words
+    rows += [
+        {"title": "", "url": "https://example.org/empty", "excerpt": None},
+        {"title": "Direct payments", "url": "https://example.org/title-hit", "excerpt": "direct payments"},
+        {"title": "Farm", "url": "https://example.org/short", "excerpt": "subsidies for farms"},
+        {"title": "Sub dies", "url": "https://example.org/split", "excerpt": "paymentsdirect"},
+    ]
+    return rows
+
+
+ROWS = reference_rows()
+ENGINE = ranking.RankingEngine(corpus.build_snapshot(ROWS, 1))
+QUERIES = ["farm", "CAP direct", "agri", "a", "farm farm", "zzz", " ", "", "ü", "über", "i̇stanbul",
+           "sub dies", "rural development", "of", "es pay", "ment", "Dairy Water climate", "direct payments"]
+QUERIES += [" ".join(random.Random(n).choices(WORDS, k=n % 3 + 1)) for n in range(60)]
+
+
+@pytest.mark.parametrize("q", QUERIES)
+@pytest.mark.parametrize("top_k", [None, 1, 5, 50])
+def test_engine_matches_rank_results(q, top_k):
+    expected = rank_results(ROWS, q)
+    if top_k is not None:
+        expected = expected[:top_k]
+    got = [d.to_dict() for d in ENGINE.search(q, top_k)]
+    assert [r["url"] for r in got] == [r["url"] for r in expected]
@@ -0,0 +1,162 @@
+# Deadlines, retries, hedging and the circuit breaker around upstream calls.
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import httpx
+import pytest
+
+import resilience
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_hung_attempt_is_abandoned_and_retried_within_the_deadline():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            await asyncio.sleep(10)  # a worker that never answers
+        return "ok"
+
+    start = time.monotonic()
+    stats = {}
+    assert run(resilience.call(attempt, deadline=0.6, retries=2, backoff=0, stats=stats)) == "ok"
+    assert time.monotonic() - start < 0.5
+    assert stats["attempts"] == 2
+    assert calls[0] == pytest.approx(0.2, abs=0.01)  # deadline / (retries + 1)
+
+
+def test_explicit_attempt_timeout_and_deadline_bound_every_attempt():
+    async def attempt(timeout):
+        await asyncio.sleep(10)
+
+    start = time.monotonic()
+    with pytest.raises(resilience.Unavailable, match="deadline"):
+        run(resilience.call(attempt, deadline=0.3, retries=5, backoff=0, attempt_timeout=0.1))
+    assert time.monotonic() - start < 0.45
+
+
+def test_non_retryable_error_is_raised_without_retrying():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        run(resilience.call(attempt, deadline=1, retries=3, retryable=lambda e: False))
+    assert len(calls) == 1
+
+
+def test_slow_attempt_is_hedged_and_the_fast_one_wins():
+    latency = resilience.LatencyTracker(min_samples=5)
+    for _ in range(10):
+        latency.observe(0.01)
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+            return "slow"
+        return "fast"
+
+    stats = {}
+    start = time.monotonic()
+    assert run(resilience.call(attempt, deadline=5, latency=latency, hedge_percentile=95, stats=stats)) == "fast"
+    assert time.monotonic() - start < 0.5
+    assert stats == {"attempts": 1, "hedges": 1}
+
+
+def test_no_hedging_without_enough_latency_samples():
+    latency = resilience.LatencyTracker(min_samples=20)
+    stats = {}
+
+    async def attempt(timeout):
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    run(resilience.call(attempt, deadline=1, latency=latency, hedge_percentile=50, stats=stats))
+    assert stats.get("hedges", 0) == 0
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    async def failing(timeout):
+        raise httpx.ConnectError("down")
+
+    async def ok(timeout):
+        return "ok"
+
+    for _ in range(2):
+        with pytest.raises(resilience.Unavailable):
+            run(resilience.call(failing, deadline=1, retries=0, breaker=breaker))
+    assert breaker.state == "open" and breaker.trips == 1
+    with pytest.raises(resilience.Unavailable, match="circuit open"):
+        run(resilience.call(ok, deadline=1, breaker=breaker))
+    assert breaker.rejected == 1
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()  # the probe failed: open again, for a fresh reset_timeout
+    assert breaker.state == "open" and breaker.trips == 2
+
+    time.sleep(0.06)
+    assert run(resilience.call(ok, deadline=1, breaker=breaker)) == "ok"
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    breaker = resilience.CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    async def hang(timeout):
+        await asyncio.sleep(10)
+
+    async def probe_and_cancel():
+        task = asyncio.ensure_future(resilience.call(hang, deadline=5, breaker=breaker))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(probe_and_cancel())
+    assert breaker.state == "open"
+    assert breaker.allow()
+
+
+def test_worker_retry_sends_a_freshly_signed_envelope(monkeypatch):
+    import handler
+    import main
+
+    secret = "test-secret"
+    bodies = []
+
+    def worker(request: httpx.Request) -> httpx.Response:
+        bodies.append((request.content, request.headers["x-signature"]))
+        if len(bodies) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"reply": "[]"})
+
+    monkeypatch.setattr(main, "WORKER_URL", "http://worker.test")
+    monkeypatch.setattr(main, "WORKER_SHARED_SECRET", secret)
+    monkeypatch.setattr(main, "WORKER_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(main, "worker_breaker", resilience.CircuitBreaker(5, 30))
+    monkeypatch.setattr(handler, "_client", httpx.AsyncClient(transport=httpx.MockTransport(worker)))
+
+    assert run(main.forward_to_worker({"model": "m", "messages": []})) == {"reply": "[]"}
+    assert len(bodies) == 2
+    envelopes = [json.loads(raw) for raw, _ in bodies]
+    assert envelopes[0]["nonce"] != envelopes[1]["nonce"]
+    for raw, signature in bodies:
+        assert signature == "sha256=" + hmac.new(secret.encode(), raw, hashlib.sha256).hexdigest()
@@ -0,0 +1,26 @@
+# The persisted semantic index must round-trip without pickle.
+import numpy as np
+import pytest
+
+import semantic
+
+
+def test_save_load_round_trip(tmp_path):
+    index = semantic.SemanticIndex.build(semantic.synthetic_docs(300), dim=16)
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    with np.load(path, allow_pickle=False) as f:
+        assert f["urls"].dtype.kind == "U" and f["terms"].dtype.kind == "U"
+    loaded = semantic.SemanticIndex.load(path)
+    assert loaded.urls == index.urls and loaded.terms == index.terms
+    assert all(type(u) is str for u in loaded.urls)
+    for q in ("dairy milk prices", "irrigation drought", "fleet quotas"):
+        assert loaded.search(q, 5) == index.search(q, 5)
+
+
+def test_load_rejects_previous_format(tmp_path):
+    # version 1 stored object arrays, which would need allow_pickle to read
+    path = str(tmp_path / "old.npz")
+    np.savez(path, version=np.asarray(1), urls=np.asarray(["u"], dtype=object))
+    with pytest.raises(ValueError):
+        semantic.SemanticIndex.load(path)
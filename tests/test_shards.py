@@ -0,0 +1,37 @@
+# Committee shards: file naming and documents listed by several committees.
+import asyncio
+import os
+
+import pytest
+
+
+def joint_rows():
+    return [{"title": "Joint report on soil health", "url": "https://example.org/joint", "excerpt": "soil"},
+            {"title": "Soil monitoring opinion", "url": "https://example.org/opinion", "excerpt": "soil"}]
+
+
+@pytest.mark.parametrize("committees", [("agri", "envi"), ("envi", "agri")])
+def test_shard_files_do_not_depend_on_committee_order(fresh_main, tmp_path, committees):
+    main = fresh_main(committees)
+    assert main.shard_path("agri") == str(tmp_path / "agri_docs.db")
+    assert main.shard_path("envi") == str(tmp_path / "agri_docs.envi.db")
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".db")) == ["agri_docs.db", "agri_docs.envi.db"]
+
+
+def test_fts_search_returns_a_joint_document_once(fresh_main):
+    main = fresh_main(("agri", "envi"), SEARCH_BACKEND="fts")
+    main.upsert_documents(joint_rows(), "agri")
+    main.upsert_documents(joint_rows()[:1], "envi")
+    urls = [r["url"] for r in main.search_documents("soil", 5)]
+    assert urls.count("https://example.org/joint") == 1
+    assert sorted(urls) == ["https://example.org/joint", "https://example.org/opinion"]
+    assert [r["url"] for r in main.search_documents("soil", 1)] == urls[:1]
+
+
+def test_snapshot_holds_a_joint_document_once(fresh_main):
+    main = fresh_main(("agri", "envi"), SEARCH_BACKEND="memory")
+    main.upsert_documents(joint_rows(), "agri")
+    main.upsert_documents(joint_rows()[:1], "envi")
+    snapshot = asyncio.run(main.refresh_snapshot())
+    assert sorted(d.url for d in snapshot.docs) == ["https://example.org/joint", "https://example.org/opinion"]
+    assert len(main.search_documents("soil", 5)) == 2
@@ -0,0 +1,49 @@
+# Cold start: an empty index triggers a crawl, and the FTS path serves queries
+# without loading the corpus into memory.
+import asyncio
+import functools
+
+import jobs
+from stub_site import StubSite
+
+
+def use_site(main, monkeypatch, site: StubSite):
+    runner = jobs.JobRunner(functools.partial(main.crawl_and_index, transport=site.transport()))
+    monkeypatch.setattr(main, "reindex_jobs", runner)
+    return runner
+
+
+def test_startup_crawls_when_every_shard_is_empty(fresh_main, monkeypatch):
+    main = fresh_main(SEARCH_BACKEND="fts")
+    runner = use_site(main, monkeypatch, StubSite(documents=5))
+
+    async def run():
+        await main.startup()
+        assert runner.running()
+        while runner.running():
+            await asyncio.sleep(0.01)
+        await runner.close()
+        assert runner.last.state == "done" and runner.last.upserted == 5
+        assert len(await main.run_read(main.search_documents, "farm", 10)) == 5
+
+    asyncio.run(run())
+
+
+def test_startup_serves_fts_without_loading_the_snapshot(fresh_main, monkeypatch):
+    main = fresh_main(SEARCH_BACKEND="fts")
+    runner = use_site(main, monkeypatch, StubSite(documents=5))
+    main.upsert_documents([{"title": "Farm income report", "url": "https://example.org/1", "excerpt": "farm"}])
+    # a saved semantic index, as after any earlier crawl
+    main.build_semantic_index(main.current_snapshot())
+    monkeypatch.setattr(main, "_snapshot", None)
+
+    async def run():
+        await main.startup()
+        await asyncio.sleep(0.05)
+        assert runner.runs == 0
+        assert [r["url"] for r in await main.run_read(main.search_documents, "farm", 5)] == ["https://example.org/1"]
+        assert main._snapshot is None
+        assert (await main.api_corpus())["documents"] == 1
+        await runner.close()
+
+    asyncio.run(run())
@@ -61,6 +61,18 @@ export default {
         })
       });
 
+      // Streaming: relay the upstream SSE body as it arrives
+      if (payload.stream && hfResp.ok) {
+        return new Response(hfResp.body, {
+          status: 200,
+          headers: {
+            ...corsHeaders(env),
+            "Content-Type": "text/event-stream; charset=UTF-8",
+            "Cache-Control": "no-cache"
+          }
+        });
+      }
+
       const text = await hfResp.text();
       let body;
       try { body = JSON.parse(text); } catch { body = { reply: text }; }